@@ -0,0 +1,87 @@
+'''
+Compares reading local files into new bytes objects, one per block, with reading them into pooled buffers, see
+sftpsync.buffers, reporting for each how many block buffers, and bytes, are allocated, and how much CPU time is spent,
+per GB moved to a sink (os.devnull), so that regressions of the data path are visible.
+Usage:
+    python -m benchmarks.buffers_benchmark [GB to move, default: 1] [block size in bytes, default: 32768]
+'''
+import os
+import time
+import shutil
+import tempfile
+from sys import argv
+from sftpsync.buffers import pooled
+from sftpsync.transfer import _read, _read_into
+
+FILE_SIZE = 128 * 1024 * 1024
+GB        = 1024 * 1024 * 1024
+
+
+class Sink(object):
+    '''
+    Writes blocks to os.devnull, counting the distinct buffers they were read into: each bytes object is a new one, while
+    memoryviews share the buffers they are views of.
+    '''
+    def __init__(self):
+        self._f       = open(os.devnull, 'wb')
+        self._buffers = set()
+        self.buffers  = 0
+        self.bytes    = 0
+
+    def write(self, data):
+        self._f.write(data)
+        if isinstance(data, memoryview):
+            if id(data.obj) not in self._buffers:  # Pooled buffers stay alive, hence so do their ids.
+                self._buffers.add(id(data.obj))
+                self.buffers += 1
+                self.bytes   += len(data.obj)
+        else:
+            self.buffers += 1
+            self.bytes   += len(data)
+
+    def close(self):
+        self._f.close()
+
+def bytes_blocks(f, block_size):
+    for data in _read(f, 0, FILE_SIZE, block_size):
+        yield data
+
+def pooled_blocks(f, block_size):
+    with pooled(block_size) as buffers:
+        for data in _read_into(f, 0, FILE_SIZE, buffers):
+            yield data
+
+def move(path, blocks, gigabytes, block_size):
+    '''
+    Reads the file at the provided path, with blocks, until gigabytes were moved, and returns the sink they were written to
+    and the CPU time spent.
+    '''
+    sink = Sink()
+    start = time.process_time()
+    for _ in range(max(1, int(gigabytes * GB / FILE_SIZE))):
+        with open(path, 'rb') as f:
+            for data in blocks(f, block_size):
+                sink.write(data)
+    elapsed = time.process_time() - start
+    sink.close()
+    return sink, elapsed
+
+def main(argv=argv[1:]):
+    gigabytes  = float(argv[0]) if argv else 1.0
+    block_size = int(argv[1]) if len(argv) > 1 else 32768
+    folder = tempfile.mkdtemp()
+    try:
+        path = os.path.join(folder, 'file.bin')
+        with open(path, 'wb') as f:
+            for _ in range(FILE_SIZE // (1024 * 1024)):
+                f.write(os.urandom(1024 * 1024))
+        moved = max(1, int(gigabytes * GB / FILE_SIZE)) * FILE_SIZE / float(GB)
+        print('%-8s %16s %16s %12s' % ('', 'buffers/GB', 'MB allocated/GB', 'CPU s/GB'))
+        for name, blocks in (('bytes', bytes_blocks), ('pooled', pooled_blocks)):
+            sink, elapsed = move(path, blocks, gigabytes, block_size)
+            print('%-8s %16d %16.2f %12.3f' % (name, sink.buffers / moved, sink.bytes / moved / 1024 / 1024, elapsed / moved))
+    finally:
+        shutil.rmtree(folder)
+
+if __name__ == '__main__':
+    main()
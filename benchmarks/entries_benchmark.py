@@ -0,0 +1,56 @@
+'''
+Reports how many bytes each entry of an in-memory index takes, for paramiko's SFTPAttributes and for
+sftpsync.entries.Entry, so that regressions of the latter are visible.
+Usage:
+    python -m benchmarks.entries_benchmark [number of entries, default: 100000]
+'''
+import gc
+import tracemalloc
+from sys import argv
+from stat import S_IFREG
+from paramiko import SFTPAttributes
+from sftpsync.entries import Entry
+
+
+def index_of_attributes(paths):
+    index = {}
+    for i, path in enumerate(paths):
+        attributes = SFTPAttributes()
+        attributes.filename = path.rpartition('/')[2]
+        attributes.st_size, attributes.st_mtime, attributes.st_mode = i, 1500000000 + i, S_IFREG | 0o644
+        index[path] = attributes
+    return index
+
+def index_of_entries(paths):
+    index = {}
+    for i, path in enumerate(paths):
+        index[path] = Entry(path, i, 1500000000 + i, S_IFREG | 0o644)
+    return index
+
+def synthetic_paths(n, files_per_folder=100):
+    return ['folder%s/sub%s/file%s.txt' % (i // (files_per_folder * 10), i // files_per_folder, i) for i in range(n)]
+
+def bytes_per_entry(build, paths):
+    '''
+    Returns the number of bytes allocated per entry when building an index of the provided paths with build, not
+    counting the paths themselves, i.e. the keys of the index.
+    '''
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        index = build(paths)
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del index
+    return float(after - before) / len(paths)
+
+def main(argv=argv[1:]):
+    n = int(argv[0]) if argv else 100000
+    paths = synthetic_paths(n)
+    for name, build in (('SFTPAttributes', index_of_attributes), ('Entry', index_of_entries)):
+        print('%-16s %8.1f bytes/entry (%s entries)' % (name, bytes_per_entry(build, paths), n))
+
+if __name__ == '__main__':
+    main()
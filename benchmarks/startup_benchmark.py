@@ -0,0 +1,55 @@
+'''
+Measures how long the command line takes to start, e.g. to print --help or reject invalid arguments, and lists the
+slowest modules it imports, as reported by python -X importtime. Heavy modules (paramiko, cryptography, socks) are
+flagged, as they should only be imported once a synchronization starts.
+Usage:
+    python -m benchmarks.startup_benchmark [number of runs, default: 20]
+'''
+import os
+import time
+import subprocess
+from sys import argv, executable
+
+HEAVY = ('paramiko', 'cryptography', 'socks', 'nacl', 'bcrypt')
+ROOT  = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def wall_clock(args, runs):
+    '''
+    Returns the durations, in seconds, of runs executions of the command line with the provided arguments.
+    '''
+    durations = []
+    with open(os.devnull, 'w') as devnull:
+        for _ in range(runs):
+            start = time.time()
+            subprocess.call([executable, '-m', 'sftpsync.command_line'] + args, cwd=ROOT, stdout=devnull, stderr=devnull)
+            durations.append(time.time() - start)
+    return durations
+
+def imports(args):
+    '''
+    Returns (cumulative microseconds, module) tuples, slowest first, for the modules imported by the command line.
+    '''
+    with open(os.devnull, 'w') as devnull:
+        process = subprocess.Popen([executable, '-X', 'importtime', '-m', 'sftpsync.command_line'] + args, cwd=ROOT, stdout=devnull, stderr=subprocess.PIPE)
+        _, err = process.communicate()
+    modules = []
+    for line in err.decode().splitlines():
+        if line.startswith('import time:') and '|' in line and 'cumulative' not in line:
+            _, cumulative, module = line[len('import time:'):].split('|')
+            modules.append((int(cumulative), module.strip()))
+    return sorted(modules, reverse=True)
+
+def main(argv=argv[1:]):
+    runs = int(argv[0]) if argv else 20
+    for name, args in (('--help', ['--help']), ('invalid arguments', ['--jobs', 'zero', 'a', 'b'])):
+        durations = sorted(wall_clock(args, runs))
+        modules = imports(args)
+        heavy = sorted(set(module.split('.')[0] for _, module in modules if module.split('.')[0] in HEAVY))
+        print('%-18s min: %6.1fms, median: %6.1fms, %s modules imported, heavy: %s' % (
+            name, durations[0] * 1000, durations[len(durations) // 2] * 1000, len(modules), ', '.join(heavy) or 'none'))
+        for cumulative, module in modules[:5]:
+            print('    %8.1fms %s' % (cumulative / 1000.0, module))
+
+if __name__ == '__main__':
+    main()
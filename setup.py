@@ -11,6 +11,7 @@ config = {
     'author_email': 'carre.marc@gmail.com',
     'version': '0.1',
     'install_requires': comma_separated_dependencies(),
+    'python_requires': '>=3.7',
     'packages': ['sftpsync'],
     'scripts': [],
     'name': 'sftpsync'
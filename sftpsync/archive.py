@@ -0,0 +1,79 @@
+import tarfile
+from shlex import quote
+from paramiko import SSHException
+
+
+MAX_FILE_SIZE   = 1024 * 1024       # Larger files gain nothing from being archived.
+MAX_BATCH_FILES = 1000
+MAX_BATCH_SIZE  = 16 * 1024 * 1024
+
+class ArchiveFailed(Exception):
+    pass
+
+class ExecRefused(ArchiveFailed):
+    '''
+    The server does not let us run tar: there is no point trying again.
+    '''
+    pass
+
+
+def eligible(attributes, existing, config):
+    '''
+    Returns whether the file with the provided attributes is worth sending as part of an archive rather than on its own:
+    only small files are, unless they are to be updated with a delta transfer.
+    '''
+    return attributes.st_size <= MAX_FILE_SIZE and not (config['delta'] and existing is not None)
+
+def command(root, preserve=False):
+    '''
+    Returns the command extracting a tar stream, read from the standard input, into the provided remote folder.
+    Unless preserve is True, modification times are not restored, and modes are subject to the server's umask, as for
+    files created over SFTP.
+    '''
+    return 'tar -x -f - -C %s %s' % (quote(root), '-p' if preserve else '-m')
+
+def push(source_fs, destination_fs, entries, preserve=False, block_size=32768, callback=None):
+    '''
+    Sends the files at the provided (path, attributes) entries of source_fs to the remote destination_fs as a single tar
+    stream, piped to tar over an SSH exec channel opened alongside destination_fs' SFTP channel, hence without a round trip
+    per file. Folders must already exist on the destination.
+    If provided, callback is called with the size of each file sent.
+    Returns the number of bytes sent. Raises ExecRefused if the server does not allow running tar, and ArchiveFailed if
+    tar failed, in which case some of the files may have been written: all of them should be sent again.
+    '''
+    channel = destination_fs.sftp.get_channel().get_transport().open_session()
+    try:
+        try:
+            channel.exec_command(command(destination_fs.root, preserve))
+        except SSHException as e:
+            raise ExecRefused('exec request refused (%s)' % e)
+        sent = 0
+        with tarfile.open(fileobj=_ChannelWriter(channel), mode='w|', bufsize=block_size) as tar:
+            for path, attributes in entries:
+                info = tarfile.TarInfo(path)
+                info.size  = attributes.st_size
+                info.mtime = int(attributes.st_mtime)
+                info.mode  = attributes.st_mode & 0o7777 if preserve else 0o666
+                with source_fs.open(path, 'rb') as f:
+                    tar.addfile(info, f)
+                sent += attributes.st_size
+                if callback:
+                    callback(attributes.st_size)
+        channel.shutdown_write()
+        status = channel.recv_exit_status()
+        if status in (126, 127):  # Shell could not find or run tar.
+            raise ExecRefused('tar not available (exit status %s)' % status)
+        if status != 0:
+            error = channel.makefile_stderr('rb').read().decode('utf-8', 'replace').strip()
+            raise ArchiveFailed('tar exited with status %s: %s' % (status, error))
+        return sent
+    finally:
+        channel.close()
+
+
+class _ChannelWriter(object):
+    def __init__(self, channel):
+        self._channel = channel
+
+    def write(self, data):
+        self._channel.sendall(data)
@@ -0,0 +1,60 @@
+from threading import Lock
+from contextlib import contextmanager
+
+
+MAX_POOLED = 256  # Buffers kept per block size once released, beyond which they are left to the garbage collector.
+
+class BufferPool(object):
+    '''
+    Pool of preallocated bytearrays of block_size bytes, which files are read into, see acquire() and release(), so that
+    copying a file does not allocate a new bytes object per block.
+    '''
+    def __init__(self, block_size, size=MAX_POOLED):
+        self.block_size = block_size
+        self._size      = size
+        self._free      = []
+        self._lock      = Lock()
+
+    def acquire(self, count=1):
+        '''
+        Returns a list of count buffers, taken from the pool, or allocated if there are not enough of them.
+        '''
+        with self._lock:
+            taken = self._free[-count:] if count else []
+            del self._free[len(self._free) - len(taken):]
+        return taken + [bytearray(self.block_size) for _ in range(count - len(taken))]
+
+    def release(self, buffers):
+        '''
+        Puts the provided buffers back in the pool. They must not be used anymore, nor any memoryview of them.
+        '''
+        with self._lock:
+            self._free.extend(buffers[:max(0, self._size - len(self._free))])
+
+    def __len__(self):
+        return len(self._free)
+
+
+_pools = {}  # Block size -> BufferPool
+_lock  = Lock()
+
+def pool(block_size):
+    '''
+    Returns the BufferPool shared by all copies of block_size bytes blocks.
+    '''
+    with _lock:
+        if block_size not in _pools:
+            _pools[block_size] = BufferPool(block_size)
+        return _pools[block_size]
+
+@contextmanager
+def pooled(block_size, count=1):
+    '''
+    Acquires count buffers of block_size bytes from the shared pool for the duration of the with block.
+    '''
+    shared  = pool(block_size)
+    buffers = shared.acquire(count)
+    try:
+        yield buffers
+    finally:
+        shared.release(buffers)
@@ -0,0 +1,129 @@
+import os
+import mmap
+import logging
+import multiprocessing
+from hashlib import md5
+from threading import Lock, local
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+
+
+_logger = logging.getLogger(__name__)
+
+MIN_POOLED_SIZE = 1024 * 1024  # Smaller files are hashed faster than they would be handed to another process.
+REMOTE_THREADS  = 8
+
+class Checksums(object):
+    '''
+    Compares files by the MD5 digests of their content, computed:
+    - for local files, by a pool of processes (one per core), over memory-mapped files. Digests are cached by device,
+      inode, size and modification time, so that files left untouched are not hashed again: see cache.
+    - for remote files, by the server itself, using the "check-file" SFTP extension, up to threads files at a time, each
+      thread using its own file system object (for remote locations: its own SFTP channel).
+    source and destination are the locations, as returned by sftpsync.command_line.configure(), of the file systems
+    created by calling source_fs and destination_fs.
+    '''
+    def __init__(self, source, source_fs, destination, destination_fs, cache=None, processes=None, threads=REMOTE_THREADS):
+        self._sides     = ((source, source_fs), (destination, destination_fs))
+        self._processes = processes or os.cpu_count() or 1
+        self._threads   = threads
+        self._pool      = None
+        self._workers   = None
+        self._local     = local()  # Per thread: side index -> file system.
+        self._fss       = []
+        self._lock      = Lock()
+        self._remote    = True  # Whether servers can hash files.
+        self.cache      = cache if cache is not None else {}  # (device, inode, size, mtime in ns) -> hex digest
+
+    def compare(self, path):
+        '''
+        Returns a _Comparison of the source and destination files at the provided path.
+        Once a server was found unable to hash files, no file is hashed anymore, on either side.
+        '''
+        if not self._remote and any(isinstance(location, dict) for location, _ in self._sides):
+            return _Comparison(_resolved(None), _resolved(None))
+        return _Comparison(*[self._digest(i, path) for i in range(len(self._sides))])
+
+    def close(self):
+        if self._pool:
+            self._pool.shutdown()
+        if self._workers:
+            self._workers.shutdown()
+        for fs in self._fss:
+            fs.close()
+
+    def _digest(self, i, path):
+        location = self._sides[i][0]
+        if isinstance(location, dict):
+            if self._workers is None:
+                self._workers = ThreadPoolExecutor(self._threads)
+            return self._workers.submit(self._remote_digest, i, path)
+        full_path = os.path.join(location, *path.split('/'))
+        stat = os.stat(full_path)
+        key = (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        if key in self.cache:
+            future = _resolved(self.cache[key])
+        elif stat.st_size < MIN_POOLED_SIZE:
+            future = _resolved(self._cached(key, digest(full_path)))
+        else:
+            if self._pool is None:  # Not forked: the parent process runs SSH transport threads.
+                self._pool = ProcessPoolExecutor(self._processes, mp_context=multiprocessing.get_context('spawn'))
+            future = self._pool.submit(digest, full_path)
+            future.add_done_callback(lambda f: f.exception() is None and self._cached(key, f.result()))
+        return future
+
+    def _cached(self, key, value):
+        self.cache[key] = value
+        return value
+
+    def _remote_digest(self, i, path):
+        if not self._remote:
+            return None
+        fss = self._local.__dict__.setdefault('fss', {})
+        if i not in fss:
+            fss[i] = self._sides[i][1]()
+            with self._lock:
+                self._fss.append(fss[i])
+        try:
+            with fss[i].open(path, 'rb') as f:
+                return f.check('md5', 0, 0, 0).hex()
+        except IOError as e:
+            _logger.warning('Server cannot hash files (%s): comparing sizes and modification times instead.', e)
+            self._remote = False
+            return None
+
+
+class _Comparison(object):
+    '''
+    Pending comparison of the digests of two files: result() is True if they are the same, False if they differ, and
+    None if they could not be computed for both files.
+    '''
+    __slots__ = ('_source', '_destination')
+
+    def __init__(self, source, destination):
+        self._source, self._destination = source, destination
+
+    def done(self):
+        return self._source.done() and self._destination.done()
+
+    def result(self):
+        source, destination = self._source.result(), self._destination.result()
+        if source is None or destination is None:
+            return None
+        return source == destination
+
+
+def _resolved(value):
+    future = Future()
+    future.set_result(value)
+    return future
+
+def digest(path):
+    '''
+    Returns the hex MD5 digest of the content of the local file at the provided path.
+    '''
+    hash = md5()
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as content:
+                hash.update(content)
+    return hash.hexdigest()
@@ -4,11 +4,19 @@ import os
 from os import linesep
 from getopt import getopt, GetoptError
 import re
-import socks
+import logging
 from getpass import getuser
+from sftpsync.filters import Filter
 
 
-ERROR_ILLEGAL_ARGUMENTS = 2
+# Same values as PySocks' socks.SOCKS4 and socks.SOCKS5: socks, like paramiko and the rest of the synchronization engine,
+# is only imported once a synchronization actually starts, so that --help and invalid arguments are handled quickly.
+SOCKS4 = 1
+SOCKS5 = 2
+
+
+ERROR_SYNCHRONIZATION_FAILED = 1
+ERROR_ILLEGAL_ARGUMENTS      = 2
 
 def usage(error_message=None):
     if error_message:
@@ -16,26 +24,56 @@ def usage(error_message=None):
 
     sys.stdout.write(linesep.join([
         'Usage:',
-        '    sftpsync.py [OPTION]... SOURCE DESTINATION',
+        '    sftpsync.py [OPTION]... SOURCE DESTINATION [DESTINATION]...',
         'Pull:',
         '    sftpsync.py [OPTION]... [s]ftp://[user[:password]@]host[:port][/path] /path/to/local/copy',
         'Push:',
         '    sftpsync.py [OPTION]... /path/to/local/copy [s]ftp://[user[:password]@]host[:port][/path]',
+        'Push to multiple servers at once, reading each file only once:',
+        '    sftpsync.py [OPTION]... /path/to/local/copy [s]ftp://[user[:password]@]host[:port][/path] [s]ftp://...',
         '',
         'Defaults:',
         '    user:     anonymous',
         '    password: anonymous',
-        '    port:     22',
+        '    port:     22 for SFTP, 21 for FTP (sftp:// and ftp:// respectively)',
         '    path:     /',
         '',
         'Options:',
+        '--adaptive      Adjust the number of files transferred in parallel, up to -j/--jobs, and of requests in flight, up to --window, to the throughput observed,',
+        '                backing off, and retrying failed files, when the server drops connections.',
+        '--block-size N  Size, in bytes, of each read and write. Default is 32768.',
+        '--bwlimit RATE  Limit the overall bandwidth used, across all transfers, to RATE KiB per second. RATE may also be suffixed by K, M or G, e.g. 10M.',
+        '--checksum      Compare files with the same size on both sides by the MD5 digest of their content, rather than by modification time.',
+        '                Local files are hashed by one process per core, and their digests cached in the --manifest, if any. Remote files are hashed by the server,',
+        '                which must support the "check-file" SFTP extension: sizes and modification times are compared otherwise.',
+        '--connections N Maximum number of SSH connections to open to the server, channels being spread over them. Default is 1.',
+        '--debounce MS   With --watch, wait for MS milliseconds without any change before synchronizing, so that bursts of changes are synchronized at once. Default is 1000.',
+        '--delete        Delete files and folders present in the destination but not in the source.',
+        '--delta         Update files already present in the destination by only sending the blocks which changed, rather than the whole files.',
+        '                Requires the server to support the "check-file" SFTP extension or, for pushes, a --manifest recording the blocks previously sent.',
+        '--detect-renames',
+        '                With --delete, move files renamed or moved in the source within the destination, rather than sending them again and deleting the old ones.',
+        '                Files of 1 MiB or more are paired by size, and either content, if it can be hashed on both sides, or modification time.',
+        '--exclude PATTERN',
+        '                Leave out files and folders matching PATTERN, on both sides: excluded folders are not even listed, and nothing excluded is deleted.',
+        '                PATTERN is a glob, as for rsync(1): "*" does not match "/", "**" does, a trailing "/" only matches folders, and a "/" anywhere else anchors',
+        '                PATTERN at the root; otherwise, names are matched at any depth. Regular expressions, searched for in relative paths, are prefixed with "re:".',
+        '                Can be repeated, along with --include: the first rule matching a path decides, and paths matching none are included.',
         '-f/--force      Force the synchronization regardless of files\' presence or timestamps.',
+        '                Also restarts interrupted copies of files of 32 MiB or more from scratch, rather than resuming them.',
         '-F config_file  Specifies an alternative per-user configuration file.',
         '                If a configuration file is given on the command line, the system-wide configuration file (/etc/ssh/ssh_config) will be ignored.',
         '                The default for the per-user configuration file is ~/.ssh/config.',
+        '                Servers\' keys are checked against ~/.ssh/known_hosts, or the UserKnownHostsFile it sets: those of unknown servers are rejected unless StrictHostKeyChecking is accept-new, no or off.',
         '-h/--help       Prints this!',
         '-i/--identity identity_file',
         '                Selects the file from which the identity (private key) for public key authentication is read.',
+        '--include PATTERN',
+        '                Include files and folders matching PATTERN, even if later --exclude rules match them. See --exclude.',
+        '-j/--jobs N     Number of files to transfer in parallel, each over its own SFTP channel, or FTP control and passive data connections. Default is 4.',
+        '--manifest manifest_file',
+        '                SQLite file in which to record what each successful synchronization saw. Remote folders whose modification time did not change since then are not listed again,',
+        '                only checked. Note that files modified in place, which leaves the modification time of their folder unchanged, may then go unnoticed: delete the manifest to force a full listing.',
         '-o ssh_option',
         '                Can be used to pass options to ssh in the format used in ssh_config(5). This is useful for specifying options for which there is no separate sftpsync command-line flag.',
         '                For full details of the options listed below, and their possible values, see ssh_config(5).',
@@ -47,7 +85,15 @@ def usage(error_message=None):
         '                Version of the SOCKS protocol to use. Default is SOCKS5.',
         '-q/--quiet:     Quiet mode: disables the progress meter as well as warning and diagnostic messages from ssh(1).',
         '-r/--recursive: Recursively synchronize entire directories.',
+        '--stats stats_file',
+        '                Writes counters (files, bytes, errors, connections, ...) and timings of each phase (connect, auth, listing, diff, transfer, metadata, ...) as JSON to stats_file, or to the standard output if "-".',
+        '--stripes N     Split files larger than 32 MiB into up to N byte ranges, transferred at the same time over separate SFTP channels. Default is 1.',
+        '--tar           Push files smaller than 1 MiB in batches, as tar archives extracted on the server by tar(1) over an SSH exec channel, rather than one by one over SFTP.',
+        '                Much faster for trees of many small files. Falls back to SFTP if the server does not allow it.',
         '-v/--verbose:   Verbose mode. Causes sftpsync to print debugging messages about their progress. This is helpful in debugging connection, authentication, and configuration problems.',
+        '--watch         Keep running after the first synchronization, and push changes made to the local source as they happen, over the same connections.',
+        '                Only the folders in which changes happened are compared again. Requires Linux (inotify).',
+        '--window N      Maximum number of SFTP read requests in flight per file, writes being pipelined as well. Default is 64.',
         ''
     ]))
 
@@ -55,24 +101,52 @@ def configure(argv):
     try:
         # Default configuration:
         config = {
+            'adaptive':  False,
+            'checksum':  False,
+            'delete':    False,
+            'delta':     False,
+            'renames':   False,
             'force':     False,
             'preserve':  False,
             'quiet':     False,
             'recursive': False,
+            'tar':       False,
             'verbose':   False,
+            'watch':     False,
+            'jobs':      4,
+            'block_size':    32768,
+            'window':        64,
+            'stripes':       1,
+            'bwlimit':       None,
+            'debounce':      1.0,
+            'connections':   1,
+            'manifest':      None,
+            'stats':         None,
             'private_key':   None,
             'proxy':         None,
-            'proxy_version': socks.SOCKS5,
+            'proxy_version': SOCKS5,
             'ssh_config' :   '~/.ssh/config',
             'ssh_options':   {},
+            'filter':        None,
         }
+        rules = []
 
-        opts, args = getopt(argv, 'fF:hi:o:pqrv', ['force', 'help', 'identity=', 'preserve', 'proxy=', 'proxy-version=', 'quiet', 'recursive', 'verbose'])
+        opts, args = getopt(argv, 'fF:hi:j:o:pqrv', ['adaptive', 'block-size=', 'bwlimit=', 'checksum', 'connections=', 'debounce=', 'delete', 'delta', 'detect-renames', 'exclude=', 'force', 'help', 'identity=', 'include=', 'jobs=', 'manifest=', 'preserve', 'proxy=', 'proxy-version=', 'quiet', 'recursive', 'stats=', 'stripes=', 'tar', 'verbose', 'watch', 'window='])
         for opt, value in opts:
             if opt in ('-h', '--help'):
                 usage()
                 exit()
 
+            if opt == '--adaptive':
+                config['adaptive']  = True
+            if opt == '--checksum':
+                config['checksum']  = True
+            if opt == '--delete':
+                config['delete']    = True
+            if opt == '--delta':
+                config['delta']     = True
+            if opt == '--detect-renames':
+                config['renames']   = True
             if opt in ('-f', '--force'):
                 config['force']     = True
             if opt in ('-p', '--preserve'):
@@ -81,31 +155,69 @@ def configure(argv):
                 config['quiet']     = True
             if opt in ('-r', '--recursive'):
                 config['recursive'] = True
+            if opt == '--tar':
+                config['tar']       = True
             if opt in ('-v', '--verbose'):
                 config['verbose']   = True
+            if opt == '--watch':
+                config['watch']     = True
 
             if opt in ('-i', '--identity'):
                 config['private_key']    = _validate_private_key_path(value)
+            if opt in ('-j', '--jobs'):
+                config['jobs']           = _validate_positive_integer(value, 'number of jobs')
 
+            if opt == '--block-size':
+                config['block_size']     = _validate_positive_integer(value, 'block size')
+            if opt == '--bwlimit':
+                config['bwlimit']        = _validate_and_parse_bandwidth(value)
+            if opt == '--connections':
+                config['connections']    = _validate_positive_integer(value, 'number of connections')
+            if opt == '--debounce':
+                config['debounce']       = _validate_positive_integer(value, 'debounce delay') / 1000.0
+            if opt == '--stripes':
+                config['stripes']        = _validate_positive_integer(value, 'number of stripes')
+            if opt == '--window':
+                config['window']         = _validate_positive_integer(value, 'window')
+            if opt == '--manifest':
+                config['manifest']       = _validate_manifest_path(value)
+            if opt == '--stats':
+                config['stats']          = _validate_stats_path(value)
             if opt == '--proxy':
                 config['proxy']          = _validate_and_parse_socks_proxy(value)
             if opt == '--proxy-version':
                 config['proxy_version']  = _validate_and_parse_socks_proxy_version(value)
 
+            if opt in ('--exclude', '--include'):
+                rules.append((opt == '--include', _validate_pattern(value)))
+
             if opt == '-F':
                 config['ssh_config']     = _validate_ssh_config_path(value)
             if opt == '-o':
                 k, v = _validate_ssh_option(value)
                 config['ssh_options'][k] = v
 
+        if rules:
+            config['filter']             = Filter(rules)
+
         if config['verbose'] and config['quiet']:
             raise ValueError('Please provide either -q/--quiet OR -v/--verbose, but NOT both at the same time.')
 
-        if len(args) != 2:
-            raise ValueError('Please provide a source and a destination. Expected 2 arguments but got %s: %s.' % (len(args), args))
-        (source, destination) = args
-        config['source']      = _validate_source(source)
-        config['destination'] = _validate_destination(destination)
+        if len(args) < 2:
+            raise ValueError('Please provide a source and at least one destination. Expected 2 arguments or more but got %s: %s.' % (len(args), args))
+        config['source']       = _validate_source(args[0])
+        config['destinations'] = [_validate_destination(destination) for destination in args[1:]]
+        config['destination']  = config['destinations'][0]
+        if len(config['destinations']) > 1:
+            _validate_fan_out(config)
+        if config['renames'] and not config['delete']:
+            raise ValueError('--detect-renames requires --delete.')
+        if config['watch']:
+            _validate_watch(config)
+        if config['tar'] and (isinstance(config['source'], dict) or not isinstance(config['destination'], dict) or config['destination'].get('protocol') == 'ftp'):
+            raise ValueError('--tar is only supported when pushing a local folder to an SFTP server.')
+        if any(isinstance(location, dict) and location.get('protocol') == 'ftp' for location in [config['source']] + config['destinations']):
+            _validate_ftp(config)
 
         return config
     except GetoptError as e:
@@ -115,6 +227,54 @@ def configure(argv):
         usage(str(e))
         exit(ERROR_ILLEGAL_ARGUMENTS)
 
+def _validate_fan_out(config):
+    if isinstance(config['source'], dict) or not all(isinstance(destination, dict) for destination in config['destinations']):
+        raise ValueError('Multiple destinations are only supported when pushing a local folder to SFTP or FTP servers.')
+    for option, enabled in (('--delta', config['delta']), ('--manifest', config['manifest']), ('--stripes', config['stripes'] > 1), ('--tar', config['tar']), ('--detect-renames', config['renames']), ('--checksum', config['checksum'])):
+        if enabled:
+            raise ValueError('%s is not supported with multiple destinations.' % option)
+
+def _validate_ftp(config):
+    if config['delta']:
+        raise ValueError('--delta is not supported over FTP.')
+    if config['proxy']:
+        raise ValueError('--proxy is not supported over FTP.')
+    if config['stripes'] > 1 and any(isinstance(location, dict) for location in config['destinations']):
+        raise ValueError('--stripes is only supported over FTP when pulling: FTP servers cannot preallocate files.')
+
+def _validate_watch(config):
+    if isinstance(config['source'], dict):
+        raise ValueError('--watch is only supported when pushing a local folder.')
+    if not sys.platform.startswith('linux'):
+        raise ValueError('--watch relies on inotify, hence is only supported on Linux.')
+    if config['manifest']:
+        raise ValueError('--manifest is not supported with --watch.')
+
+def _validate_positive_integer(value, name):
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+    if number < 1:
+        raise ValueError('Invalid %s: "%s". Please provide a positive integer.' % (name, value))
+    return number
+
+_UNITS = {'': 1024, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+def _validate_and_parse_bandwidth(value):
+    '''
+    Returns the provided bandwidth, in KiB per second unless suffixed by K, M or G, in bytes per second.
+    '''
+    match = re.search(r'^(\d+(\.\d*)?)([KMG]?)$', value.upper())
+    if not match or float(match.group(1)) * _UNITS[match.group(3)] < 1:
+        raise ValueError('Invalid bandwidth limit: "%s". Please provide a positive number of KiB per second, optionally suffixed by K, M or G, e.g. 512 or 10M.' % value)
+    return int(float(match.group(1)) * _UNITS[match.group(3)])
+
+def _validate_pattern(pattern):
+    if not pattern or pattern in ('/', 're:'):
+        raise ValueError('Invalid pattern: "%s". Please provide a glob, or a regular expression prefixed with "re:".' % pattern)
+    return pattern
+
 def _validate_private_key_path(path):
     if not path:
         raise ValueError('Invalid path: "%s". Please provide a valid path to your private key.' % path)
@@ -129,6 +289,22 @@ def _validate_ssh_config_path(path):
         raise ValueError('Invalid path: "%s". Provided path does NOT exist. Please provide a valid path to your SSH configuration.' % path)
     return path
 
+def _validate_manifest_path(path):
+    if not path:
+        raise ValueError('Invalid path: "%s". Please provide a valid path to your manifest.' % path)
+    if not os.path.isdir(os.path.dirname(os.path.abspath(os.path.expanduser(path)))):
+        raise ValueError('Invalid path: "%s". Parent folder does NOT exist. Please provide a valid path to your manifest.' % path)
+    return path
+
+def _validate_stats_path(path):
+    if path == '-':
+        return path
+    if not path:
+        raise ValueError('Invalid path: "%s". Please provide a valid path to write statistics to, or "-" for the standard output.' % path)
+    if not os.path.isdir(os.path.dirname(os.path.abspath(os.path.expanduser(path)))):
+        raise ValueError('Invalid path: "%s". Parent folder does NOT exist. Please provide a valid path to write statistics to.' % path)
+    return path
+
 def _validate_ssh_option(option, white_list=['ProxyCommand']):
     key_value = option.split('=', 1) if '=' in option else option.split(' ', 1)
     if not key_value or not len(key_value) == 2:
@@ -168,7 +344,13 @@ def _validate_and_parse_socks_proxy(proxy):
     return _validate_and_parse_connection_string(proxy, _PROXY_PATTERN, 'Invalid proxy: "%s".' % proxy)
 
 def _validate_and_parse_sftp(sftp):
-    return _validate_and_parse_connection_string(sftp, _SFTP_PATTERN, 'Invalid SFTP connection details: "%s".' % sftp)
+    '''
+    Parses the provided SFTP, or FTP, connection string. The latter are marked with 'protocol': 'ftp'.
+    '''
+    remote = _validate_and_parse_connection_string(sftp, _SFTP_PATTERN, 'Invalid SFTP connection details: "%s".' % sftp)
+    if sftp.startswith('ftp://'):
+        remote['protocol'] = 'ftp'
+    return remote
 
 def _validate_and_parse_connection_string(connection_string, pattern, error_message):
     '''
@@ -183,7 +365,7 @@ def _validate_and_parse_connection_string(connection_string, pattern, error_mess
 def _validate_and_parse_socks_proxy_version(socks_version, white_list=['SOCKS4', 'SOCKS5']):
     if socks_version not in white_list:
         raise ValueError('Invalid SOCKS proxy version: "%s". Please choose one of the following values: { %s }.' % (socks_version, ', '.join(white_list)))
-    return eval('socks.%s' % socks_version)
+    return {'SOCKS4': SOCKS4, 'SOCKS5': SOCKS5}[socks_version]
 
 def _validate_source(source):
     if _is_sftp(source):
@@ -218,3 +400,38 @@ def _validate_is_writable_path(path):
     if not os.access(os.path.abspath(path), os.W_OK):
         raise ValueError('Invalid path. "%s" exists but user "%s" does NOT have write access.' % (path, getuser()))
     return path
+
+def _write_stats(path, stats):
+    if path == '-':
+        sys.stdout.write(stats.to_json() + linesep)
+    else:
+        with open(os.path.expanduser(path), 'w') as f:
+            f.write(stats.to_json() + linesep)
+
+def main(argv=argv[1:]):
+    config = configure(argv)
+    from sftpsync.sftpsync import sync, watch, SyncError
+    from sftpsync.stats import Stats
+    from sftpsync.progress import Progress
+    logging.basicConfig(format='%(message)s', level=logging.DEBUG if config['verbose'] else logging.ERROR if config['quiet'] else logging.WARNING)
+    stats = Stats()
+    try:
+        if config['watch']:
+            try:
+                watch(config, stats, config['debounce'])
+            except KeyboardInterrupt:
+                pass
+        elif config['quiet'] or not sys.stderr.isatty():
+            sync(config, stats=stats)
+        else:
+            with Progress(sys.stderr) as progress:
+                sync(config, stats=stats, progress=progress)
+    except SyncError as e:
+        sys.stderr.write('ERROR: ' + str(e) + linesep)
+        exit(ERROR_SYNCHRONIZATION_FAILED)
+    finally:
+        if config['stats']:
+            _write_stats(config['stats'], stats)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,320 @@
+import os
+import re
+import glob
+import time
+import shlex
+import socket
+from io import StringIO
+import logging
+from threading import Lock
+import socks
+from paramiko import SSHConfig, SSHConfigDict, Transport, SFTPClient, SFTPFile, ProxyCommand, HostKeys, RSAKey, ECDSAKey, Ed25519Key, SSHException
+from paramiko.common import DEFAULT_WINDOW_SIZE
+from sftpsync.stats import Stats
+
+
+_logger = logging.getLogger(__name__)
+
+def ssh_config(path='~/.ssh/config'):
+    '''
+    Returns an SSHConfig object containing dictionaries for each hostname.
+    Each dictionary contains at least {'hostname': <host>}.
+    If ~/.ssh/config is present and contains some directives, it will parse them and add the relevant fields to the dictionnary.
+    If provided path does not exist, an empty SSHConfig is returned.
+    Include directives are resolved, as ssh(1) does: relative paths are relative to ~/.ssh, and may contain wildcards.
+    Parsed configurations are cached, and only parsed again once the file, or any of the files it includes, changed.
+    Lookups are cached as well, per host.
+    '''
+    path = os.path.abspath(os.path.expanduser(path))
+    with _ssh_configs_lock:
+        cached = _ssh_configs.get(path)
+        if cached and cached[0] == _signature(cached[1]):
+            return cached[2]
+        files = []
+        config = _CachedSSHConfig()
+        config.parse(StringIO(_read_ssh_config(path, files)))
+        _ssh_configs[path] = (_signature(files), files, config)
+        return config
+
+_ssh_configs = {}  # Path -> (signature, files read, SSHConfig)
+_ssh_configs_lock = Lock()
+_INCLUDE = re.compile(r'^\s*include(?:\s*=\s*|\s+)(.+?)\s*$', re.IGNORECASE)
+
+def _read_ssh_config(path, files, depth=0, max_depth=16):
+    '''
+    Returns the content of the SSH configuration at the provided path, with the content of the files it includes
+    inlined, and adds all the files and folders read to the provided list.
+    '''
+    files.append(path)
+    if not os.path.isfile(path):
+        return ''
+    lines = []
+    with open(path) as f:
+        for line in f:
+            match = _INCLUDE.match(line)
+            if not match:
+                lines.append(line if line.endswith('\n') else line + '\n')
+                continue
+            if depth >= max_depth:
+                raise SSHException('Too many levels of Include in %s.' % path)
+            for pattern in shlex.split(match.group(1)):
+                pattern = os.path.join(os.path.expanduser('~/.ssh'), os.path.expanduser(pattern))
+                files.append(os.path.dirname(pattern))  # So that new files matching the pattern are noticed.
+                for included in sorted(glob.glob(pattern)):
+                    lines.append(_read_ssh_config(included, files, depth + 1))
+    return ''.join(lines)
+
+def _signature(paths):
+    '''
+    Returns the modification times and sizes of the provided files, to tell whether any of them changed.
+    '''
+    signature = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            signature.append((stat.st_mtime, stat.st_size))
+        except OSError:
+            signature.append(None)
+    return signature
+
+
+class _CachedSSHConfig(SSHConfig):
+    '''
+    SSHConfig caching the result of lookup() per host, and indexing Host blocks by the literal host names they list, so
+    that each lookup only goes through the blocks which may apply: those listing the host, and those with wildcards,
+    negations or Match criteria. Order, hence precedence, is kept as is.
+    '''
+    def __init__(self):
+        super(_CachedSSHConfig, self).__init__()
+        self._lookups = {}
+
+    def parse(self, file_obj):
+        super(_CachedSSHConfig, self).parse(file_obj)
+        self._literals, self._generic = {}, []
+        # Canonicalization looks hosts up again, under another name: only index blocks if it is never enabled.
+        self._indexed = not any('canonicalizehostname' in block['config'] for block in self._config)
+        for i, block in enumerate(self._config):
+            patterns = block.get('host')
+            if patterns is None or any(_WILDCARDS.search(pattern) for pattern in patterns):
+                self._generic.append(i)
+            else:
+                for pattern in set(patterns):
+                    self._literals.setdefault(pattern, []).append(i)
+
+    def lookup(self, hostname):
+        options = self._lookups.get(hostname)
+        if options is None:
+            options = self._lookups[hostname] = SSHConfig.lookup(self._candidates(hostname), hostname)
+        return SSHConfigDict(options)
+
+    def _candidates(self, hostname):
+        if not self._indexed:
+            return self
+        candidates = SSHConfig()
+        candidates._config = [self._config[i] for i in sorted(self._generic + self._literals.get(hostname, []))]
+        return candidates
+
+_WILDCARDS = re.compile(r'[*?\[!]')
+
+
+class ConnectionFailed(Exception):
+    pass
+
+
+class ConnectionPool(object):
+    '''
+    Keeps authenticated SSH transports alive and hands out SFTP channels over them, so that handshakes, authentication
+    and proxy negotiation are only paid once per connection, rather than once per file or per worker.
+    Remotes are keyed by their connection details, once resolved through the SSH configuration, hence different
+    aliases of the same server share connections. Up to config['connections'] transports are opened per server, lazily,
+    and new channels go to the least loaded one. Released channels are kept open, and handed out again.
+    Connections and channels opened are counted, and timed, in the provided sftpsync.stats.Stats, if any.
+    FTP remotes get control connections from an sftpsync.ftp.FTPPool instead, see ftp().
+    '''
+    def __init__(self, config, stats=None):
+        self._config      = config
+        self._stats       = stats or Stats()
+        self._ssh_config  = ssh_config(os.path.expanduser(config['ssh_config']))
+        self._window_size = max(DEFAULT_WINDOW_SIZE, config['window'] * SFTPFile.MAX_REQUEST_SIZE)
+        self._lock        = Lock()
+        self._locks       = {}  # Per server, to serialize the opening of transports.
+        self._transports  = {}  # Server -> [transport, ...]
+        self._channels    = {}  # Transport -> number of open channels.
+        self._idle        = {}  # Server -> [SFTP client, ...]
+        self._ftp         = None
+
+    def resolve(self, remote):
+        '''
+        Returns the (hostname, port, user) the provided remote, as parsed by sftpsync.command_line._validate_and_parse_sftp(),
+        actually connects to, along with the SSH configuration for its host.
+        '''
+        host_config = self._ssh_config.lookup(remote['host'])
+        hostname = host_config.get('hostname', remote['host'])
+        port     = int(remote.get('port') or host_config.get('port') or 22)
+        user     = remote.get('user') or host_config.get('user') or 'anonymous'
+        return (hostname, port, user), host_config
+
+    def channel(self, remote):
+        '''
+        Returns an SFTP client, either idle or newly opened, for the provided remote.
+        Once done with it, callers should hand it back using release().
+        '''
+        server, host_config = self.resolve(remote)
+        with self._lock:
+            idle = self._idle.get(server, [])
+            while idle:
+                sftp = idle.pop()
+                if not sftp.get_channel().closed:
+                    return sftp
+                self._closed(sftp)
+            lock = self._locks.setdefault(server, Lock())
+        with lock:
+            transport = self._transport(server, remote, host_config)
+            with self._lock:
+                self._channels[transport] += 1
+        with self._stats.timer('channel'):
+            sftp = SFTPClient.from_transport(transport, window_size=self._window_size)
+        self._stats.count('channels')
+        return sftp
+
+    def ftp(self, remote):
+        '''
+        Returns a logged in FTP client, either idle or newly opened, for the provided FTP remote.
+        Once done with it, callers should hand it back using release().
+        '''
+        with self._lock:
+            if self._ftp is None:
+                from sftpsync.ftp import FTPPool  # Which depends on this module.
+                self._ftp = FTPPool(self._config, self._stats)
+        return self._ftp.connection(remote)
+
+    def release(self, remote, sftp):
+        if is_ftp(remote):
+            self._ftp.release(remote, sftp)
+            return
+        server, _ = self.resolve(remote)
+        with self._lock:
+            if sftp.get_channel().closed:
+                self._closed(sftp)
+            else:
+                self._idle.setdefault(server, []).append(sftp)
+
+    def close(self):
+        if self._ftp:
+            self._ftp.close()
+        with self._lock:
+            for transports in self._transports.values():
+                for transport in transports:
+                    transport.close()
+            self._transports, self._channels, self._idle = {}, {}, {}
+
+    def _closed(self, sftp):
+        transport = sftp.get_channel().get_transport()
+        if transport in self._channels:
+            self._channels[transport] -= 1
+
+    def _transport(self, server, remote, host_config):
+        with self._lock:
+            transports = [t for t in self._transports.get(server, []) if t.is_active()]
+            for transport in set(self._transports.get(server, [])) - set(transports):
+                del self._channels[transport]
+            self._transports[server] = transports
+            if len(transports) >= self._config['connections']:
+                return min(transports, key=lambda t: self._channels[t])
+        transport = connect(server, remote.get('pass'), host_config, self._config, self._stats)
+        self._stats.count('connections')
+        _logger.debug('Opened connection to %s@%s:%s.', server[2], server[0], server[1])
+        with self._lock:
+            self._transports[server].append(transport)
+            self._channels[transport] = 0
+        return transport
+
+
+def is_ftp(remote):
+    '''
+    Returns whether the provided remote, as parsed by sftpsync.command_line._validate_and_parse_sftp(), is an FTP server.
+    '''
+    return isinstance(remote, dict) and remote.get('protocol') == 'ftp'
+
+def connect(server, password, host_config, config, stats=None):
+    '''
+    Opens and authenticates an SSH transport to the provided (hostname, port, user), as resolved by
+    ConnectionPool.resolve(), going through the SOCKS proxy or ProxyCommand, if any.
+    The private key from the command line or the SSH configuration is used if any, the password otherwise.
+    The time taken to connect (up to the key exchange) and to authenticate is recorded in the provided Stats, if any.
+    '''
+    hostname, port, user = server
+    stats = stats or Stats()
+    start = time.time()
+    try:
+        transport = Transport(_socket(hostname, port, host_config, config))
+    except (IOError, OSError, socks.ProxyError) as e:
+        raise ConnectionFailed('Failed to connect to %s:%s: %s' % (hostname, port, e))
+    try:
+        transport.start_client()
+        _verify_host_key(transport, hostname, port, host_config)
+        stats.record('connect', time.time() - start)
+        with stats.timer('auth'):
+            key = _private_key(config['private_key'] or next(iter(host_config.get('identityfile', [])), None))
+            if key:
+                transport.auth_publickey(user, key)
+            else:
+                transport.auth_password(user, password or 'anonymous')
+        return transport
+    except SSHException as e:
+        transport.close()
+        raise ConnectionFailed('Failed to authenticate as "%s" on %s:%s: %s' % (user, hostname, port, e))
+    except Exception:
+        transport.close()
+        raise
+
+def _socket(hostname, port, host_config, config):
+    if config['proxy']:
+        proxy = config['proxy']
+        sock = socks.socksocket()
+        sock.set_proxy(config['proxy_version'], proxy['host'], int(proxy.get('port', 1080)), username=proxy.get('user'), password=proxy.get('pass'))
+        sock.connect((hostname, port))
+        return sock
+    proxy_command = config['ssh_options'].get('ProxyCommand') or host_config.get('proxycommand')
+    if proxy_command:
+        return ProxyCommand(proxy_command.replace('%h', hostname).replace('%p', str(port)))
+    return socket.create_connection((hostname, port))
+
+def _verify_host_key(transport, hostname, port, host_config, known_hosts='~/.ssh/known_hosts'):
+    '''
+    Verifies the server's key against the known hosts files, as ssh(1) does: those listed by UserKnownHostsFile in the
+    SSH configuration, if any, known_hosts otherwise. Keys not matching the one known for the server are rejected, and so
+    are those of unknown servers, unless StrictHostKeyChecking is "accept-new", "no" or "off", in which case they are
+    added to the first known hosts file.
+    '''
+    host = hostname if port == 22 else '[%s]:%s' % (hostname, port)
+    paths = [os.path.expanduser(path.replace('%d', '~')) for path in host_config.get('userknownhostsfile', known_hosts).split() if path != 'none']
+    host_keys = HostKeys()
+    for path in paths:
+        if os.path.isfile(path):
+            host_keys.load(path)
+    known_keys = host_keys.lookup(host)
+    key = transport.get_remote_server_key()
+    if known_keys and key.get_name() in known_keys:
+        if known_keys[key.get_name()] != key:
+            raise ConnectionFailed('Host key for %s does NOT match the one in %s.' % (host, ', '.join(paths)))
+        return
+    if host_config.get('stricthostkeychecking', 'yes').lower() not in ('accept-new', 'no', 'off'):
+        raise ConnectionFailed('Host key for %s is unknown: please add it to %s first, e.g. by connecting with ssh(1).' % (host, paths[0] if paths else known_hosts))
+    if paths:
+        try:
+            with open(paths[0], 'a') as f:
+                f.write('%s %s %s\n' % (host, key.get_name(), key.get_base64()))
+        except (IOError, OSError) as e:
+            _logger.warning('Failed to add the host key for %s to %s: %s', host, paths[0], e)
+
+def _private_key(path, key_types=(RSAKey, ECDSAKey, Ed25519Key)):
+    if not path:
+        return None
+    path = os.path.expanduser(path)
+    for key_type in key_types:
+        try:
+            return key_type.from_private_key_file(path)
+        except SSHException:
+            pass
+    raise SSHException('Unsupported or invalid private key: "%s".' % path)
@@ -0,0 +1,91 @@
+from hashlib import md5
+from paramiko import SFTPFile
+from sftpsync.buffers import pooled
+from sftpsync.ftp import FTPFile
+from sftpsync.transfer import _blocks, _preserve
+
+
+BLOCK_SIZE = 64 * 1024
+_DIGEST_SIZE = md5().digest_size
+
+def copy_delta(source_fs, destination_fs, path, attributes, destination_hashes=None, preserve=False, block_size=32768, window=64, callback=None):
+    '''
+    Updates the existing destination file at the provided path by only writing the BLOCK_SIZE blocks of the source file
+    which differ from the destination's, at their offsets, then truncating the destination to the source's size.
+    Block hashes are computed locally for local files, and requested to the server (using the "check-file" SFTP
+    extension) for remote files. For remote destinations whose server does not support it, the hashes recorded for the
+    destination when it was last written (destination_hashes) are used instead.
+    If hashes cannot be obtained for both sides, nothing is written and None is returned, so that the caller falls back
+    to a full copy. Otherwise, returns a (number of bytes written, source hashes) tuple.
+    If provided, callback is called with the size of each block written.
+    If the update fails, the destination's modification time is reset, so that it does not pass for up to date, half
+    updated as it may be, and gets copied again.
+    '''
+    with source_fs.open(path, 'rb') as source:
+        source_hashes = block_hashes(source)
+        if source_hashes is None:
+            return None
+        try:
+            with destination_fs.open(path, 'r+b') as destination, pooled(block_size) as buffers:
+                existing = block_hashes(destination)
+                if existing is None:
+                    existing = destination_hashes
+                if existing is None:
+                    return None
+                if isinstance(destination, SFTPFile):
+                    destination.set_pipelined(True)
+                written = 0
+                for offset, length in changed_ranges(source_hashes, existing, attributes.st_size):
+                    destination.seek(offset)
+                    for data in _blocks(source, offset, length, block_size, window, buffers):
+                        destination.write(data)
+                        written += len(data)
+                        if callback:
+                            callback(len(data))
+                destination.truncate(attributes.st_size)
+        except Exception:
+            _outdate(destination_fs, path)
+            raise
+    if preserve:
+        _preserve(destination_fs, path, attributes)
+    return written, source_hashes
+
+def _outdate(fs, path):
+    try:
+        fs.utime(path, (0, 0))
+    except (IOError, OSError):
+        pass  # E.g. the connection was lost: the file is then left as is.
+
+def block_hashes(f):
+    '''
+    Returns the concatenated MD5 digests of the provided file's successive BLOCK_SIZE blocks, or None if the file is
+    remote and its server does not support the "check-file" SFTP extension (which FTP servers never do): remote files
+    are never read to be hashed.
+    '''
+    if isinstance(f, (SFTPFile, FTPFile)):
+        try:
+            return f.check('md5', 0, 0, BLOCK_SIZE)
+        except IOError:
+            return None
+    hashes = []
+    f.seek(0)
+    for block in iter(lambda: f.read(BLOCK_SIZE), b''):
+        hashes.append(md5(block).digest())
+    return b''.join(hashes)
+
+def changed_ranges(source_hashes, destination_hashes, size):
+    '''
+    Returns the (offset, length) ranges of the source, of at most size bytes, whose blocks differ from the destination's,
+    adjacent blocks being merged into a single range.
+    '''
+    ranges = []
+    for i in range(0, len(source_hashes), _DIGEST_SIZE):
+        if source_hashes[i:i + _DIGEST_SIZE] == destination_hashes[i:i + _DIGEST_SIZE]:
+            continue
+        offset = (i // _DIGEST_SIZE) * BLOCK_SIZE
+        length = min(BLOCK_SIZE, size - offset)
+        if ranges and sum(ranges[-1]) == offset:
+            ranges[-1] = (ranges[-1][0], ranges[-1][1] + length)
+        else:
+            ranges.append((offset, length))
+    return ranges
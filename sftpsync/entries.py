@@ -0,0 +1,34 @@
+class Entry(object):
+    '''
+    Compact, read-only stand-in for paramiko's SFTPAttributes, for the entries kept in memory for a whole tree (e.g.
+    indexes loaded from, or saved to, a Manifest): only the fields synchronization relies on are kept, in slots rather
+    than in a per-instance dictionary. The entry's relative path is the very string indexes use as key, and its file
+    name is derived from it, rather than stored separately.
+    '''
+    __slots__ = ('path', 'st_size', 'st_mtime', 'st_mode', 'hash')
+    st_atime = None
+
+    def __init__(self, path, size, mtime, mode, hash=None):
+        self.path     = path
+        self.st_size  = size
+        self.st_mtime = mtime
+        self.st_mode  = mode
+        self.hash     = hash
+
+    @property
+    def filename(self):
+        return self.path.rpartition('/')[2]
+
+    def __repr__(self):
+        return 'Entry(%r, size=%s, mtime=%s, mode=%o)' % (self.path, self.st_size, self.st_mtime, self.st_mode or 0)
+
+
+def entry(path, attributes):
+    '''
+    Returns the Entry for the file or folder at the provided relative path, described by the provided attributes, e.g.
+    as returned by listdir_attr().
+    '''
+    if isinstance(attributes, Entry):
+        return attributes
+    mtime = attributes.st_mtime
+    return Entry(path, attributes.st_size, int(mtime) if mtime is not None else None, attributes.st_mode, getattr(attributes, 'hash', None))
@@ -0,0 +1,181 @@
+import os
+import posixpath
+from stat import S_ISDIR, S_ISREG
+from paramiko import SFTPAttributes
+
+
+class LocalFileSystem(object):
+    '''
+    Local folder exposed through the same (subset of the) interface as paramiko's SFTPClient.
+    All paths are relative to the root folder, and use '/' as separator, e.g. '' for the root itself, or 'a/b.txt'.
+    '''
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, path):
+        return os.path.join(self.root, *path.split('/')) if path else self.root
+
+    def listdir_attr(self, path=''):
+        '''
+        Symbolic links are followed, except dangling ones, which are listed as links, hence neither as files nor folders.
+        '''
+        attributes = []
+        for entry in os.scandir(self._path(path)):
+            try:
+                stat = entry.stat(follow_symlinks=True)
+            except (IOError, OSError):
+                stat = entry.stat(follow_symlinks=False)
+            attributes.append(SFTPAttributes.from_stat(stat, entry.name))
+        return attributes
+
+    def stat(self, path=''):
+        return SFTPAttributes.from_stat(os.stat(self._path(path)), posixpath.basename(path))
+
+    def open(self, path, mode='rb'):
+        return open(self._path(path), mode)
+
+    def mkdir(self, path):
+        os.mkdir(self._path(path))
+
+    def remove(self, path):
+        os.remove(self._path(path))
+
+    def rmdir(self, path):
+        os.rmdir(self._path(path))
+
+    def rename(self, path, new_path):
+        os.rename(self._path(path), self._path(new_path))
+
+    def replace(self, path, new_path):
+        os.replace(self._path(path), self._path(new_path))
+
+    def utime(self, path, times):
+        os.utime(self._path(path), times)
+
+    def chmod(self, path, mode):
+        os.chmod(self._path(path), mode)
+
+    def close(self):
+        pass
+
+
+class RemoteFileSystem(object):
+    '''
+    Remote folder, accessed over the provided SFTP channel.
+    All paths are relative to the root folder, and use '/' as separator, e.g. '' for the root itself, or 'a/b.txt'.
+    Once closed, the channel is handed to release, if provided, e.g. to give it back to its connection pool.
+    '''
+    def __init__(self, sftp, root='/', release=None):
+        self.sftp = sftp
+        self.root = root
+        self._release = release
+
+    def _path(self, path):
+        return posixpath.join(self.root, path) if path else self.root
+
+    def listdir_attr(self, path=''):
+        return self.sftp.listdir_attr(self._path(path))
+
+    def stat(self, path=''):
+        attributes = self.sftp.stat(self._path(path))
+        attributes.filename = posixpath.basename(path)
+        return attributes
+
+    def open(self, path, mode='rb'):
+        return self.sftp.open(self._path(path), mode)
+
+    def mkdir(self, path):
+        self.sftp.mkdir(self._path(path))
+
+    def remove(self, path):
+        self.sftp.remove(self._path(path))
+
+    def rmdir(self, path):
+        self.sftp.rmdir(self._path(path))
+
+    def rename(self, path, new_path):
+        self.sftp.rename(self._path(path), self._path(new_path))
+
+    def replace(self, path, new_path):
+        '''
+        Same as rename(), except that new_path is atomically replaced if it exists, as long as the server supports the
+        "posix-rename@openssh.com" extension. Otherwise, it is removed first.
+        '''
+        try:
+            self.sftp.posix_rename(self._path(path), self._path(new_path))
+        except IOError:
+            if exists(self, new_path):
+                self.remove(new_path)
+            self.rename(path, new_path)
+
+    def utime(self, path, times):
+        self.sftp.utime(self._path(path), times)
+
+    def chmod(self, path, mode):
+        self.sftp.chmod(self._path(path), mode)
+
+    def close(self):
+        if self._release:
+            self._release(self.sftp)
+        else:
+            self.sftp.close()
+
+
+class TimedFileSystem(object):
+    '''
+    Wraps the provided file system, recording how long its listings and metadata operations take in the provided
+    sftpsync.stats.Stats, under the 'listing', 'metadata' (mkdir, utime, chmod, rename, replace) and 'delete' (remove, rmdir) phases.
+    '''
+    def __init__(self, fs, stats):
+        self.fs = fs
+        self._stats = stats
+
+    def __getattr__(self, name):
+        return getattr(self.fs, name)
+
+    def listdir_attr(self, path=''):
+        with self._stats.timer('listing'):
+            attributes = self.fs.listdir_attr(path)
+        self._stats.count('listed')
+        return attributes
+
+    def mkdir(self, path):
+        with self._stats.timer('metadata'):
+            self.fs.mkdir(path)
+
+    def utime(self, path, times):
+        with self._stats.timer('metadata'):
+            self.fs.utime(path, times)
+
+    def chmod(self, path, mode):
+        with self._stats.timer('metadata'):
+            self.fs.chmod(path, mode)
+
+    def rename(self, path, new_path):
+        with self._stats.timer('metadata'):
+            self.fs.rename(path, new_path)
+
+    def replace(self, path, new_path):
+        with self._stats.timer('metadata'):
+            self.fs.replace(path, new_path)
+
+    def remove(self, path):
+        with self._stats.timer('delete'):
+            self.fs.remove(path)
+
+    def rmdir(self, path):
+        with self._stats.timer('delete'):
+            self.fs.rmdir(path)
+
+
+def is_dir(attributes):
+    return attributes.st_mode is not None and S_ISDIR(attributes.st_mode)
+
+def is_file(attributes):
+    return attributes.st_mode is not None and S_ISREG(attributes.st_mode)
+
+def exists(fs, path):
+    try:
+        return fs.stat(path)
+    except (IOError, OSError):
+        return None
@@ -0,0 +1,95 @@
+import re
+
+
+REGEX_PREFIX = 're:'
+_GROUPS = re.compile(r'(?P<escape>\\[^1-9])|\\[1-9]|\(\?P[<=]|\(\?\(')  # Named groups, references to groups, and other escapes.
+
+class Filter(object):
+    '''
+    Include and exclude rules, as (include, pattern) pairs, compiled once into a single regular expression which the
+    paths of entries, relative to the roots of the trees synchronized, are matched against in one pass, whatever the
+    number of rules: the first rule matching a path decides whether it is included, and paths matching none are.
+    Excluded folders are pruned: their content is never listed, hence neither synchronized nor deleted.
+    Patterns are globs, as rsync(1) interprets them, unless prefixed with "re:":
+    - "*" matches anything but "/", "**" anything, "?" any single character but "/", and "[...]" any of the characters listed,
+    - patterns ending with "/" only match folders,
+    - patterns starting with, or containing, "/" match whole paths, from the root, others match names at any depth.
+    Regular expressions are searched for in paths, and may use "$" to match the end of the path, but neither named groups
+    nor references to groups, as they are all combined into one.
+    Raises ValueError if a pattern is invalid.
+    '''
+    def __init__(self, rules):
+        alternatives = []
+        for i, (include, pattern) in enumerate(rules):
+            regex = _regex(pattern)
+            try:
+                re.compile(regex)
+            except re.error as e:
+                raise ValueError('Invalid pattern: "%s" (%s).' % (pattern, e))
+            if any(match.lastgroup != 'escape' for match in _GROUPS.finditer(regex)):
+                raise ValueError('Invalid pattern: "%s" (named groups and references to groups are not supported).' % pattern)
+            alternatives.append('(?P<_rule%s>%s)' % (i, regex))
+        try:
+            self._regex = re.compile('|'.join(alternatives)) if alternatives else None
+        except re.error as e:
+            raise ValueError('Invalid patterns: %s (%s).' % (' '.join('"%s"' % pattern for _, pattern in rules), e))
+        # Rule groups enclose any group of their own pattern, hence are the last ones closed when matched.
+        self._include = dict((self._regex.groupindex['_rule%s' % i], include) for i, (include, _) in enumerate(rules)) if rules else {}
+
+    def included(self, path, folder=False):
+        '''
+        Returns whether the entry at the provided relative path, a folder if folder is True, is included.
+        '''
+        if self._regex is None:
+            return True
+        match = self._regex.fullmatch(path + '\n' if folder else path)  # A trailing newline marks folders, see _regex().
+        return match is None or self._include[match.lastindex]
+
+    def pruned(self, folder):
+        '''
+        Returns whether the provided folder, relative to the root, is excluded, or is under an excluded folder.
+        '''
+        parts = folder.split('/') if folder else []
+        return any(not self.included('/'.join(parts[:i]), True) for i in range(1, len(parts) + 1))
+
+
+def _regex(pattern):
+    '''
+    Returns the regular expression matching the same paths as the provided pattern, folders' paths being followed by a
+    newline, which "$" matches just before, and which "." and "[^/]" do not match.
+    '''
+    if pattern.startswith(REGEX_PREFIX):
+        return '.*?(?:%s).*\n?' % pattern[len(REGEX_PREFIX):]
+    folders_only = pattern.endswith('/')
+    pattern = pattern.rstrip('/')
+    anchored = '/' in pattern
+    pattern = pattern.lstrip('/')
+    return '%s%s%s' % ('' if anchored else '(?:.*/)?', _translate(pattern), '\n' if folders_only else '\n?')
+
+def _translate(glob):
+    regex, i = [], 0
+    while i < len(glob):
+        c = glob[i]
+        if glob.startswith('**/', i):
+            regex.append('(?:.*/)?')
+            i += 3
+            continue
+        if glob.startswith('**', i):
+            regex.append('.*')
+            i += 2
+            continue
+        if c == '*':
+            regex.append('[^/\n]*')
+        elif c == '?':
+            regex.append('[^/\n]')
+        elif c == '[' and ']' in glob[i + 2:]:
+            end = glob.index(']', i + 2)
+            content = glob[i + 1:end]
+            negated = content[:1] in ('!', '^')
+            regex.append('[%s%s]' % ('^/\n' if negated else '', re.escape(content[1:] if negated else content).replace('\\-', '-')))
+            i = end + 1
+            continue
+        else:
+            regex.append(re.escape(c))
+        i += 1
+    return ''.join(regex)
@@ -0,0 +1,375 @@
+import time
+import errno
+import ftplib
+import calendar
+import logging
+import posixpath
+from threading import Lock
+from contextlib import contextmanager
+from stat import S_IFDIR, S_IFREG
+from paramiko import SFTPAttributes
+from sftpsync.connection import ConnectionFailed
+from sftpsync.stats import Stats
+
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 21
+IDLE_CHECK   = 30  # Seconds after which idle connections are checked, with NOOP, before being handed out again.
+FACTS        = 'type;size;modify;unix.mode;'
+
+class FTPPool(object):
+    '''
+    Keeps logged in FTP control connections alive, and hands them out again once released, so that connecting and logging
+    in are only paid once per connection, rather than once per file or per worker. FTP only allows one transfer at a time
+    per control connection: each worker holds its own, hence config['jobs'] files are transferred at the same time, each
+    over its own passive data connection.
+    Connections opened are counted, and timed, in the provided sftpsync.stats.Stats, if any.
+    '''
+    def __init__(self, config, stats=None):
+        self._config = config
+        self._stats  = stats or Stats()
+        self._lock   = Lock()
+        self._idle   = {}     # Server -> [(FTP client, time released), ...]
+        self._open   = set()  # FTP clients, idle or not.
+
+    def resolve(self, remote):
+        '''
+        Returns the (hostname, port, user) the provided remote, as parsed by sftpsync.command_line._validate_and_parse_sftp(),
+        connects to.
+        '''
+        return remote['host'], int(remote.get('port') or DEFAULT_PORT), remote.get('user') or 'anonymous'
+
+    def connection(self, remote):
+        '''
+        Returns a logged in FTP client, either idle or newly connected, for the provided remote.
+        Once done with it, callers should hand it back using release().
+        '''
+        server = self.resolve(remote)
+        while True:
+            with self._lock:
+                idle = self._idle.get(server)
+                if not idle:
+                    break
+                ftp, released = idle.pop()
+            if _alive(ftp, released):
+                return ftp
+            self._discard(ftp)
+        ftp = connect(server, remote.get('pass'), self._stats)
+        self._stats.count('connections')
+        _logger.debug('Opened FTP connection to %s@%s:%s.', server[2], server[0], server[1])
+        with self._lock:
+            self._open.add(ftp)
+        return ftp
+
+    def release(self, remote, ftp):
+        if ftp.sock is None:  # Closed after an error.
+            self._discard(ftp)
+            return
+        with self._lock:
+            self._idle.setdefault(self.resolve(remote), []).append((ftp, time.time()))
+
+    def close(self):
+        with self._lock:
+            connections, self._open, self._idle = self._open, set(), {}
+        for ftp in connections:
+            _quit(ftp)
+
+    def _discard(self, ftp):
+        with self._lock:
+            self._open.discard(ftp)
+        _quit(ftp)
+
+
+def connect(server, password, stats=None):
+    '''
+    Opens an FTP control connection to the provided (hostname, port, user), as resolved by FTPPool.resolve(), logs in,
+    switches to binary mode, and asks for the facts needed by FTPFileSystem in MLSD listings.
+    The time taken to connect and to log in is recorded in the provided Stats, if any.
+    '''
+    hostname, port, user = server
+    stats = stats or Stats()
+    start = time.time()
+    ftp = ftplib.FTP()
+    try:
+        ftp.connect(hostname, port)
+    except ftplib.all_errors as e:
+        ftp.close()
+        raise ConnectionFailed('Failed to connect to %s:%s: %s' % (hostname, port, e))
+    stats.record('connect', time.time() - start)
+    try:
+        with stats.timer('auth'):
+            ftp.login(user, password or 'anonymous')
+        ftp.voidcmd('TYPE I')
+        try:
+            ftp.sendcmd('OPTS MLST ' + FACTS)
+        except ftplib.error_perm:  # The server then sends its default facts.
+            pass
+        return ftp
+    except ftplib.all_errors as e:
+        ftp.close()
+        raise ConnectionFailed('Failed to authenticate as "%s" on %s:%s: %s' % (user, hostname, port, e))
+
+def _alive(ftp, released):
+    if ftp.sock is None:
+        return False
+    if time.time() - released < IDLE_CHECK:
+        return True
+    try:
+        ftp.voidcmd('NOOP')
+        return True
+    except ftplib.all_errors:
+        return False
+
+def _quit(ftp):
+    try:
+        if ftp.sock is not None:
+            ftp.quit()
+    except ftplib.all_errors:
+        pass
+    finally:
+        ftp.close()
+
+
+class FTPFileSystem(object):
+    '''
+    Remote folder, accessed over the provided, logged in, FTP control connection, through the same interface as
+    sftpsync.filesystem.RemoteFileSystem. Folders are listed with MLSD, in a single round trip each, and files are
+    transferred in binary mode, over passive data connections: see FTPFile.
+    Once closed, the connection is handed to release, if provided, e.g. to give it back to its FTPPool.
+    '''
+    _warned = set()  # Commands found unsupported, so that it is only reported once.
+
+    def __init__(self, ftp, root='/', release=None):
+        self.ftp = ftp
+        self.root = root
+        self._release = release
+        self._active = None  # FTPFile transferring data, if any.
+
+    def _path(self, path):
+        return posixpath.join(self.root, path) if path else self.root
+
+    def listdir_attr(self, path=''):
+        with self.control():
+            conn = self.ftp.transfercmd('MLSD ' + self._path(path))
+            with conn:
+                data = b''.join(iter(lambda: conn.recv(65536), b''))
+            self.ftp.voidresp()
+        lines = data.decode(self.ftp.encoding).splitlines()
+        return [a for a in (_attributes(line) for line in lines) if a is not None]
+
+    def stat(self, path=''):
+        with self.control():
+            response = self.ftp.sendcmd('MLST ' + self._path(path))
+        for line in response.splitlines()[1:]:
+            attributes = _attributes(line.lstrip(' '), posixpath.basename(path)) if line.startswith(' ') else None
+            if attributes is not None:
+                return attributes
+        raise IOError(errno.ENOENT, 'No such file or folder: %s' % self._path(path))
+
+    def open(self, path, mode='rb'):
+        return FTPFile(self, self._path(path), mode)
+
+    def mkdir(self, path):
+        with self.control():
+            self.ftp.mkd(self._path(path))
+
+    def remove(self, path):
+        with self.control():
+            self.ftp.delete(self._path(path))
+
+    def rmdir(self, path):
+        with self.control():
+            self.ftp.rmd(self._path(path))
+
+    def rename(self, path, new_path):
+        with self.control():
+            self.ftp.rename(self._path(path), self._path(new_path))
+
+    def replace(self, path, new_path):
+        '''
+        Same as rename(), except that new_path is replaced if it exists: servers which refuse to rename over an existing
+        file get it removed first.
+        '''
+        try:
+            self.rename(path, new_path)
+        except IOError:
+            try:
+                self.remove(new_path)
+            except IOError:
+                pass
+            self.rename(path, new_path)
+
+    def utime(self, path, times):
+        self._optional('MFMT', '%s %s' % (time.strftime('%Y%m%d%H%M%S', time.gmtime(times[1])), self._path(path)))
+
+    def chmod(self, path, mode):
+        self._optional('SITE CHMOD', '%o %s' % (mode, self._path(path)))
+
+    def close(self):
+        try:
+            with self.control():
+                pass
+        finally:
+            if self._release:
+                self._release(self.ftp)
+            else:
+                _quit(self.ftp)
+
+    @contextmanager
+    def control(self, active=None):
+        '''
+        Ends the transfer in progress, unless it is that of the provided FTPFile, as the control connection cannot be used
+        during a transfer: the file it was for resumes from where it stopped once read from, or written to, again.
+        FTP errors are raised as IOError, and the connection closed if it cannot be used anymore.
+        '''
+        try:
+            if self._active is not None and self._active is not active:
+                self._active._end()
+            yield
+        except (ftplib.error_perm, ftplib.error_temp) as e:
+            raise IOError(str(e))
+        except (ftplib.Error, EOFError, OSError) as e:
+            self.ftp.close()
+            raise IOError(str(e))
+
+    def _optional(self, command, arguments):
+        '''
+        Sends the provided command, which is not part of the core FTP protocol, and hence ignored, with a warning, by
+        servers which do not support it.
+        '''
+        try:
+            with self.control():
+                self.ftp.voidcmd('%s %s' % (command, arguments))
+        except IOError as e:
+            if not str(e)[:3] in ('500', '501', '502', '504'):
+                raise
+            if command not in FTPFileSystem._warned:
+                FTPFileSystem._warned.add(command)
+                _logger.warning('FTP server does not support %s (%s): ignoring it.', command, e)
+
+
+class FTPFile(object):
+    '''
+    File opened on an FTPFileSystem, in 'rb', 'wb' or 'r+b' mode. Data goes through a passive data connection, opened
+    with RETR, or STOR, on the first read, or write, from the current position (sent with REST, unless 0).
+    Seeking elsewhere ends the transfer, as does any other use of the file system's control connection, and the next read,
+    or write, resumes it from there: several files can hence be open at the same time, e.g. a partial file and its
+    checkpoint, see sftpsync.transfer.copy_resumable(), as long as they are used one at a time.
+    '''
+    def __init__(self, fs, path, mode='rb'):
+        if mode not in ('rb', 'wb', 'r+b'):
+            raise ValueError('Unsupported mode for FTP files: %s' % mode)
+        self._fs, self._path, self._mode = fs, path, mode
+        self._position = 0
+        self._conn = self._stream = None
+        self._started = self._eof = False
+
+    def read(self, size=-1):
+        data = self._transfer('RETR').read(size if size is not None and size >= 0 else -1)
+        self._position += len(data)
+        self._eof = not data and size != 0
+        return data
+
+    def readinto(self, buffer):
+        read = self._transfer('RETR').readinto(buffer)
+        self._position += read
+        self._eof = not read and len(buffer) > 0
+        return read
+
+    def write(self, data):
+        self._transfer('STOR').sendall(data)
+        self._position += len(data)
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self._position
+        elif whence != 0:
+            raise IOError(errno.EINVAL, 'FTP files can only be seeked from their start or current position.')
+        if offset != self._position:
+            self._end()
+            self._position = offset
+        return offset
+
+    def tell(self):
+        return self._position
+
+    def truncate(self, size=None):
+        '''
+        FTP has no way to truncate a file: this does nothing, and bytes past size are left as they are until overwritten.
+        This is enough for sftpsync.transfer.copy_resumable(), which always writes files up to their end.
+        '''
+        pass
+
+    def flush(self):
+        pass
+
+    def check(self, *args, **kwargs):
+        raise IOError('The "check-file" SFTP extension is not available over FTP.')
+
+    def close(self):
+        if self._mode == 'wb' and not self._started:  # Creates empty files.
+            self._transfer('STOR')
+        self._end()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def _transfer(self, command):
+        if self._conn is None:
+            with self._fs.control(self):
+                self._conn, _ = self._fs.ftp.ntransfercmd('%s %s' % (command, self._path), self._position or (0 if self._mode == 'r+b' else None))
+            self._fs._active = self
+            self._started = True
+            self._stream = self._conn.makefile('rb') if command == 'RETR' else None
+        return self._stream or self._conn
+
+    def _end(self):
+        '''
+        Closes the data connection, if any, and reads the server's reply about the transfer. Reads ended before the end
+        of the file are aborted by the server (426), which is expected.
+        '''
+        if self._conn is None:
+            return
+        conn, stream, reading = self._conn, self._stream, self._stream is not None
+        self._conn = self._stream = None
+        self._fs._active = None
+        with self._fs.control(self):
+            try:
+                if stream:
+                    stream.close()
+                conn.close()
+                self._fs.ftp.voidresp()
+            except ftplib.error_temp:
+                if not reading or self._eof:
+                    raise
+
+
+def _attributes(line, name=None):
+    '''
+    Returns the SFTPAttributes of the entry described by the provided MLSD, or MLST, line, e.g.
+    "type=file;size=42;modify=20200101000000;unix.mode=0644; name", or None for the folder itself, its parent, and
+    entries which are neither files nor folders.
+    '''
+    facts, _, filename = line.partition(' ')
+    facts = dict((key.lower(), value) for key, _, value in (fact.partition('=') for fact in facts.split(';') if '=' in fact))
+    kind = facts.get('type', '').lower()
+    if kind not in ('file', 'dir') and not (name is not None and kind == 'cdir'):
+        return None
+    attributes = SFTPAttributes()
+    attributes.filename = name if name is not None else filename
+    attributes.st_size  = int(facts.get('size', 0))
+    attributes.st_mtime = _timestamp(facts['modify']) if 'modify' in facts else 0
+    mode = int(facts['unix.mode'], 8) if 'unix.mode' in facts else 0o644 if kind == 'file' else 0o755
+    attributes.st_mode  = (S_IFREG if kind == 'file' else S_IFDIR) | mode
+    return attributes
+
+def _timestamp(value):
+    '''
+    Returns the number of seconds since the epoch for the provided "YYYYMMDDHHMMSS[.sss]" UTC time, as in MLSD listings.
+    '''
+    seconds = calendar.timegm(time.strptime(value[:14], '%Y%m%d%H%M%S'))
+    return seconds + float('0' + value[14:]) if len(value) > 15 else seconds
@@ -0,0 +1,83 @@
+import os
+import json
+import sqlite3
+from sftpsync.entries import Entry
+
+
+SOURCE      = 'source'
+DESTINATION = 'destination'
+
+class Manifest(object):
+    '''
+    SQLite file recording, for each pair of source and destination, what the last successful synchronization saw on
+    each side: path, size, modification time, mode and, optionally, a hash of the file's content.
+    '''
+    def __init__(self, path, source, destination):
+        self._db  = sqlite3.connect(os.path.expanduser(path))
+        self._key = key(source, destination)
+        with self._db:
+            self._db.execute('CREATE TABLE IF NOT EXISTS entries (sync TEXT, side TEXT, path TEXT, size INTEGER, mtime INTEGER, mode INTEGER, hash TEXT, PRIMARY KEY (sync, side, path))')
+            self._db.execute('CREATE TABLE IF NOT EXISTS hashes (device INTEGER, inode INTEGER, size INTEGER, mtime INTEGER, hash TEXT, PRIMARY KEY (device, inode))')
+            self._db.execute('CREATE TABLE IF NOT EXISTS blocks (sync TEXT, path TEXT, size INTEGER, mtime INTEGER, hashes BLOB, PRIMARY KEY (sync, path))')
+
+    def load(self, side):
+        '''
+        Returns a dictionary mapping relative paths to their attributes, as sftpsync.entries.Entry objects, as recorded for
+        the provided side.
+        '''
+        entries = {}
+        for path, size, mtime, mode, hash in self._db.execute('SELECT path, size, mtime, mode, hash FROM entries WHERE sync = ? AND side = ?', (self._key, side)):
+            entries[path] = Entry(path, size, mtime, mode, hash)
+        return entries
+
+    def save(self, side, entries):
+        '''
+        Replaces all entries recorded for the provided side by the provided ones, atomically.
+        '''
+        with self._db:
+            self._db.execute('DELETE FROM entries WHERE sync = ? AND side = ?', (self._key, side))
+            self._db.executemany('INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)', (
+                (self._key, side, path, a.st_size, a.st_mtime, a.st_mode, getattr(a, 'hash', None)) for path, a in entries.items()
+            ))
+
+    def load_blocks(self):
+        '''
+        Returns a dictionary mapping relative paths of destination files to the (size, modification time, block hashes)
+        they had when they were last written, as recorded by save_blocks().
+        '''
+        return dict((path, (size, mtime, bytes(hashes))) for path, size, mtime, hashes in self._db.execute('SELECT path, size, mtime, hashes FROM blocks WHERE sync = ?', (self._key,)))
+
+    def save_blocks(self, blocks):
+        with self._db:
+            self._db.executemany('INSERT OR REPLACE INTO blocks VALUES (?, ?, ?, ?, ?)', (
+                (self._key, path, size, mtime, hashes) for path, (size, mtime, hashes) in blocks.items()
+            ))
+
+    def load_hashes(self):
+        '''
+        Returns a dictionary mapping (device, inode, size, modification time in nanoseconds) of local files to the digests
+        of their content, as recorded by save_hashes(), whichever synchronization they were computed for.
+        '''
+        return dict(((device, inode, size, mtime), hash) for device, inode, size, mtime, hash in self._db.execute('SELECT device, inode, size, mtime, hash FROM hashes'))
+
+    def save_hashes(self, hashes):
+        with self._db:
+            self._db.executemany('INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?)', (
+                (device, inode, size, mtime, hash) for (device, inode, size, mtime), hash in hashes.items()
+            ))
+
+    def close(self):
+        self._db.close()
+
+
+def key(source, destination):
+    '''
+    Identifies a synchronization by its source and destination, as returned by sftpsync.command_line.configure().
+    Passwords are left out, so that changing them does not invalidate the manifest.
+    '''
+    return json.dumps([_location(source), _location(destination)], sort_keys=True)
+
+def _location(location):
+    if isinstance(location, dict):
+        return dict((k, v) for (k, v) in location.items() if k != 'pass')
+    return os.path.abspath(location)
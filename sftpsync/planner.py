@@ -0,0 +1,57 @@
+from sftpsync.filesystem import is_dir, is_file
+from sftpsync.walker import walk
+
+
+class Plan(object):
+    '''
+    What needs to be done to synchronize a destination with a source:
+    - folders: folders to create on the destination, parents first,
+    - copy:    files to copy, as (path, source attributes) tuples,
+    - skip:    files already up to date, as (path, source attributes) tuples,
+    - delete:  files and folders present on the destination only, children first.
+    '''
+    def __init__(self):
+        self.folders = []
+        self.copy    = []
+        self.skip    = []
+        self.delete  = []
+
+
+def index(file_system, recursive=True, cache=None, jobs=1):
+    '''
+    Walks the tree of the file systems created by calling file_system, see sftpsync.walker.walk(), and returns a
+    dictionary mapping relative paths (e.g. 'a/b.txt') to their attributes.
+    '''
+    return dict(walk(file_system, recursive, jobs, cache))
+
+def plan(source, destination, force=False, preserve=False):
+    '''
+    Compares the provided source and destination indexes, as returned by index(), in one pass, and returns a Plan.
+    Unless force is True, files with the same size on both sides and a destination at least as recent as the
+    source (or exactly as recent, if preserve is True) are skipped.
+    '''
+    result = Plan()
+    for path in sorted(source):
+        attributes = source[path]
+        existing   = destination.get(path)
+        if is_dir(attributes):
+            if existing is None or not is_dir(existing):
+                result.folders.append(path)
+        elif is_file(attributes):
+            if not force and is_up_to_date(attributes, existing, preserve):
+                result.skip.append((path, attributes))
+            else:
+                result.copy.append((path, attributes))
+    result.delete = sorted((path for path in destination if path not in source), reverse=True)
+    return result
+
+def is_up_to_date(source, destination, preserve=False):
+    '''
+    Returns True if the destination file has the same size as the source file, and is not older than it.
+    If modification times are preserved, they are expected to be equal.
+    '''
+    if destination is None or not is_file(destination) or destination.st_size != source.st_size:
+        return False
+    if preserve:
+        return int(destination.st_mtime) == int(source.st_mtime)
+    return int(destination.st_mtime) >= int(source.st_mtime)
@@ -0,0 +1,118 @@
+import sys
+import time
+from threading import Thread, Event, Lock
+
+
+class Progress(object):
+    '''
+    Progress meter aggregating all concurrent transfers: bytes and files transferred out of those found so far, overall
+    throughput, ETA and number of active transfers.
+    Transfers only update a few counters, through the callbacks returned by transfer(): the line is redrawn by a
+    background thread, at most every interval seconds, hence the cost per block transferred remains negligible.
+    Usage:
+        with Progress() as progress:
+            progress.queued(size)
+            ...
+            with progress.transfer(size) as callback:
+                ... callback(len(data)) ...
+    '''
+    def __init__(self, stream=sys.stderr, interval=0.5):
+        self._stream   = stream
+        self._interval = interval
+        self._lock     = Lock()
+        self._stopped  = Event()
+        self._width    = 0
+        self.total_files = self.total_bytes = 0
+        self.files     = 0
+        self.bytes     = 0  # Transferred, or found unnecessary to transfer (e.g. unchanged blocks of delta transfers).
+        self.active    = 0
+        self.walked    = False
+
+    def __enter__(self):
+        self._started = time.time()
+        self._thread = Thread(target=self._redraw)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self._stopped.set()
+        self._thread.join()
+        self._draw()
+        self._stream.write('\n')
+        self._stream.flush()
+
+    def queued(self, size):
+        '''
+        Records a file of the provided size as to be transferred.
+        '''
+        with self._lock:
+            self.total_files += 1
+            self.total_bytes += size
+
+    def done_walking(self):
+        '''
+        Records that all files to transfer have been found, so that totals, hence the ETA, are final.
+        '''
+        self.walked = True
+
+    def transfer(self, size, files=1):
+        '''
+        Returns a context manager, for the transfer of a file (or of a batch of files) of the provided size, yielding the
+        callback to call with the number of bytes of each block transferred.
+        '''
+        return _Transfer(self, size, files)
+
+    def _redraw(self):
+        while not self._stopped.wait(self._interval):
+            self._draw()
+
+    def _draw(self):
+        line = self.line()
+        self._stream.write('\r' + line + ' ' * max(0, self._width - len(line)))
+        self._stream.flush()
+        self._width = len(line)
+
+    def line(self, now=None):
+        elapsed = max((now or time.time()) - self._started, 1e-6)
+        rate = self.bytes / elapsed
+        remaining = self.total_bytes - self.bytes
+        eta = _duration(remaining / rate) if rate and self.walked else '--:--:--'
+        more = '' if self.walked else '+'
+        return '%s/%s%s %s/%s%s files %s/s ETA %s %s active' % (
+            _size(self.bytes), _size(self.total_bytes), more, self.files, self.total_files, more, _size(rate), eta, self.active
+        )
+
+
+class _Transfer(object):
+    __slots__ = ('_progress', '_size', '_files', '_sent')
+
+    def __init__(self, progress, size, files=1):
+        self._progress, self._size, self._files, self._sent = progress, size, files, 0
+
+    def __enter__(self):
+        with self._progress._lock:
+            self._progress.active += 1
+        return self
+
+    def __call__(self, n):  # Called by all the threads copying ranges of the same file, or writing it to several destinations.
+        with self._progress._lock:
+            self._sent += n
+            self._progress.bytes += n
+
+    def __exit__(self, type, value, traceback):
+        with self._progress._lock:
+            self._progress.active -= 1
+            self._progress.files  += self._files
+            self._progress.bytes  += max(0, self._size - self._sent)
+
+
+def _size(n):
+    for unit in ('B', 'KiB', 'MiB', 'GiB', 'TiB'):
+        if n < 1024 or unit == 'TiB':
+            return '%.1f %s' % (n, unit) if unit != 'B' else '%d B' % n
+        n /= 1024.0
+
+def _duration(seconds):
+    seconds = int(seconds)
+    return '%d:%02d:%02d' % (seconds // 3600, seconds // 60 % 60, seconds % 60)
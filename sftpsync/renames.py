@@ -0,0 +1,74 @@
+from sftpsync.delta import block_hashes
+
+
+MIN_SIZE = 1024 * 1024  # Smaller files are cheaper to send again than to wait for.
+
+class Renames(object):
+    '''
+    Pairs files added to the source since the last synchronization with files present on the destination only, so that
+    files moved or renamed on the source can be moved on the destination, rather than sent again and deleted.
+    Both kinds of files show up in any order while the trees are walked, hence each of them is matched against those of
+    the other kind seen so far, and kept until a match shows up, if any: see added() and orphaned().
+    Two files match if they have the same size, and either the same content, when block hashes can be computed for both
+    of them (see sftpsync.delta.block_hashes()), or the same modification time otherwise.
+    '''
+    def __init__(self, source_fs, destination_fs):
+        self._source_fs      = source_fs
+        self._destination_fs = destination_fs
+        self._added          = {}  # Size -> {path: source attributes}
+        self._orphans        = {}  # Size -> {path: destination attributes}
+        self._hashes         = {}  # (file system, path) -> block hashes, or None if they cannot be computed.
+
+    def added(self, path, attributes):
+        '''
+        Records a file of the source missing from the destination, and returns the path of the destination file to move
+        to it, or None if none matched so far.
+        '''
+        candidates = self._orphans.get(attributes.st_size, {})
+        for orphan, orphan_attributes in list(candidates.items()):
+            if self._same(path, attributes, orphan, orphan_attributes):
+                del candidates[orphan]
+                self._forget(self._destination_fs, orphan)
+                self._forget(self._source_fs, path)
+                return orphan
+        self._added.setdefault(attributes.st_size, {})[path] = attributes
+        return None
+
+    def orphaned(self, path, attributes):
+        '''
+        Records a file of the destination missing from the source, and returns the (path, source attributes) of the
+        source file it should be moved to, or None if none matched so far.
+        '''
+        candidates = self._added.get(attributes.st_size, {})
+        for added, added_attributes in list(candidates.items()):
+            if self._same(added, added_attributes, path, attributes):
+                del candidates[added]
+                self._forget(self._source_fs, added)
+                self._forget(self._destination_fs, path)
+                return added, added_attributes
+        self._orphans.setdefault(attributes.st_size, {})[path] = attributes
+        return None
+
+    def unmatched(self):
+        '''
+        Returns the (path, attributes) of the added files, and those of the orphaned files, left without a match.
+        '''
+        return ([entry for files in self._added.values()   for entry in sorted(files.items())],
+                [entry for files in self._orphans.values() for entry in sorted(files.items())])
+
+    def _same(self, source_path, source, destination_path, destination):
+        destination_hashes = self._block_hashes(self._destination_fs, destination_path)
+        source_hashes      = self._block_hashes(self._source_fs, source_path) if destination_hashes is not None else None
+        if destination_hashes is not None and source_hashes is not None:
+            return source_hashes == destination_hashes
+        return int(source.st_mtime) == int(destination.st_mtime)
+
+    def _block_hashes(self, fs, path):
+        key = (fs, path)
+        if key not in self._hashes:
+            with fs.open(path, 'rb') as f:
+                self._hashes[key] = block_hashes(f)
+        return self._hashes[key]
+
+    def _forget(self, fs, path):
+        self._hashes.pop((fs, path), None)
@@ -0,0 +1,106 @@
+import time
+import logging
+from threading import Condition, Lock
+
+
+_logger = logging.getLogger(__name__)
+
+class Scheduler(object):
+    '''
+    Decides how many files are transferred at the same time, up to maximum, and how many requests are kept in flight
+    per file, up to window.
+    Unless adaptive is True, both are fixed. Otherwise, they are adjusted AIMD-style, every interval seconds, based on the
+    throughput observed through transferred():
+    - the number of concurrent transfers starts at 1 and doubles as long as throughput keeps increasing, then grows by
+      one at a time, and shrinks by one when throughput drops after an increase,
+    - on errors, reported through failed(), e.g. when an overloaded server drops connections, both are halved.
+    Usage, for each file:
+        with scheduler:
+            ... scheduler.window ... scheduler.transferred(len(data)) ...
+    '''
+    def __init__(self, maximum, window, adaptive=False, interval=1.0):
+        self.maximum    = maximum
+        self.max_window = window
+        self.adaptive   = adaptive
+        self.limit      = 1 if adaptive else maximum
+        self.window     = window
+        self._interval  = interval
+        self._condition = Condition(Lock())
+        self._active    = 0
+        self._bytes     = 0
+        self._sampled   = time.time()
+        self._rate      = None  # Throughput, in bytes per second, over the last interval.
+        self._growing   = True  # Slow start: doubling the limit, rather than incrementing it.
+        self._increased = False
+
+    def __enter__(self):
+        with self._condition:
+            while self._active >= self.limit:
+                self._condition.wait()
+            self._active += 1
+        return self
+
+    def __exit__(self, type, value, traceback):
+        with self._condition:
+            self._active -= 1
+            self._condition.notify()
+
+    def transferred(self, n):
+        if not self.adaptive:
+            return
+        with self._condition:
+            self._bytes += n
+            now = time.time()
+            if now - self._sampled >= self._interval:
+                self._adapt(float(self._bytes) / (now - self._sampled))
+                self._bytes, self._sampled = 0, now
+
+    def failed(self):
+        if not self.adaptive:
+            return
+        with self._condition:
+            self.limit  = max(1, self.limit // 2)
+            self.window = max(1, self.window // 2)
+            self._growing = self._increased = False
+            _logger.debug('Transfer failed: now using up to %s concurrent transfer(s), with %s request(s) in flight.', self.limit, self.window)
+
+    def _adapt(self, rate):
+        previous, self._rate = self._rate, rate
+        self.window = min(self.max_window, self.window + max(1, self.max_window // 8))
+        if previous is not None and rate < previous * 0.9 and self._increased:
+            self.limit = max(1, self.limit - 1)
+            self._growing = self._increased = False
+        elif self._active >= self.limit and (previous is None or rate > previous * 1.05 or not self._increased):
+            limit = min(self.maximum, self.limit * 2 if self._growing else self.limit + 1)
+            self._increased = limit > self.limit
+            self.limit = limit
+            self._condition.notify_all()
+        else:
+            if self._increased:  # The last increase did not pay off.
+                self._growing = False
+            self._increased = False
+        _logger.debug('%.0f bytes/s: now using up to %s concurrent transfer(s), with %s request(s) in flight.', rate, self.limit, self.window)
+
+
+class TokenBucket(object):
+    '''
+    Limits the overall throughput of all the threads sharing it to rate bytes per second, allowing bursts of up to one
+    second worth of bytes.
+    '''
+    def __init__(self, rate):
+        self.rate    = float(rate)
+        self._lock   = Lock()
+        self._tokens = self.rate
+        self._last   = time.time()
+
+    def take(self, n):
+        '''
+        Consumes n bytes worth of tokens, waiting for as long as needed for the rate to be respected.
+        '''
+        with self._lock:
+            now = time.time()
+            self._tokens = min(self.rate, self._tokens + (now - self._last) * self.rate) - n
+            self._last = now
+            wait = -self._tokens / self.rate
+        if wait > 0:
+            time.sleep(wait)
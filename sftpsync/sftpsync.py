@@ -1,15 +1,509 @@
-import os
-from paramiko import SSHConfig
+import logging
+from contextlib import nullcontext
+from threading import Thread, Lock
+from queue import Queue
+from collections import deque
+from paramiko import SSHException
+from sftpsync.connection import ConnectionPool, ConnectionFailed, ssh_config, is_ftp
+from sftpsync.filesystem import LocalFileSystem, RemoteFileSystem, TimedFileSystem, is_dir, is_file
+from sftpsync.ftp import FTPFileSystem
+from sftpsync.transfer import copy, copy_ranges, copy_resumable, fan_out, partial_of, MIN_STRIPE_SIZE, RESUMABLE_SIZE, _preserve
+from sftpsync.delta import copy_delta, block_hashes
+from sftpsync import planner, archive
+from sftpsync.walker import walk_folders, filtered, _join
+from sftpsync.manifest import Manifest, SOURCE, DESTINATION
+from sftpsync.entries import entry
+from sftpsync.stats import Stats
+from sftpsync.scheduler import Scheduler, TokenBucket
+from sftpsync.renames import Renames, MIN_SIZE as RENAME_MIN_SIZE
+from sftpsync.checksums import Checksums
 
-def ssh_config(path='~/.ssh/config'):
+
+_logger = logging.getLogger(__name__)
+
+RETRIES = 2
+RETRY_DELAY = 10
+MAX_PENDING_CHECKSUMS = 256
+
+class SyncError(Exception):
+    pass
+
+
+def sync(config, pool=None, stats=None, progress=None, folders=None):
+    '''
+    Synchronizes config['source'] into config['destinations'], as returned by sftpsync.command_line.configure().
+    All trees are walked together, config['jobs'] folders at a time, and each folder is compared as soon as it has been
+    listed on all sides: the files to copy are handed, through a bounded queue, to config['jobs'] workers, each of them
+    using its own SFTP channels from the provided ConnectionPool, if any, or from a new one, closed once done.
+    Listing, comparison and transfers hence overlap, and memory does not grow with the size of the trees.
+    With several destinations, each file is read once and written to all the destinations needing it at the same time,
+    see sftpsync.transfer.fan_out().
+    If config['manifest'] is set, remote trees are indexed incrementally, based on what the last successful
+    synchronization saw, and the manifest is updated once the synchronization succeeds (which requires keeping both
+    indexes in memory, in that case only).
+    If config['delta'] is set, files already present on the destination are updated by only sending their changed blocks.
+    If config['renames'] is set, files moved or renamed on the source are moved on the destination too, see _compare().
+    If config['checksum'] is set, files with the same size on both sides are compared by content, see _compare().
+    Counters and timers for each phase are recorded in the provided sftpsync.stats.Stats, if any, or in a new one.
+    If provided, progress (an sftpsync.progress.Progress) is kept up to date with the files found and transferred.
+    If provided, folders restricts the synchronization to the entries directly under these folders, e.g. as reported by
+    sftpsync.watch.Watcher, rather than to the whole trees.
+    If config['filter'] is set, entries it excludes are left out, on all sides, and excluded folders are never listed.
+    Returns a dictionary with the number of files and bytes copied, skipped or deleted, along with the other counters.
+    '''
+    stats = stats or Stats()
+    own_pool = pool is None
+    pool = pool or ConnectionPool(config, stats)
+    locations = config.get('destinations', [config['destination']])
+    manifest = Manifest(config['manifest'], config['source'], config['destination']) if config['manifest'] else None
+    try:
+        source       = _file_system_factory(config['source'], pool, stats)
+        destinations = [_file_system_factory(location, pool, stats) for location in locations]
+        destination_fss = []
+        source_fs = checksums = None
+        try:
+            for destination in destinations:
+                destination_fss.append(destination())
+            if config['renames'] or folders is not None:
+                source_fs = source()
+            renames = Renames(source_fs, destination_fss[0]) if config['renames'] else None
+            if config['checksum']:
+                checksums = Checksums(config['source'], source, config['destination'], destinations[0], manifest.load_hashes() if manifest else None, threads=config['jobs'])
+            caches  = [_cache(manifest, SOURCE, config['source']), _cache(manifest, DESTINATION, config['destination'])] + [None] * (len(locations) - 1)
+            indexes = ({}, {}) if manifest else None
+            blocks  = manifest.load_blocks() if manifest and config['delta'] and isinstance(config['destination'], dict) else None
+            if folders is None:
+                folders = walk_folders([source] + destinations, config['recursive'], config['jobs'], caches, config.get('filter'))
+            else:
+                folders = _list_folders(folders, [source_fs] + destination_fss, config['recursive'], config.get('filter'))
+            _transfer(_compare(folders, destination_fss, config, stats, indexes, renames, checksums), source, destinations, config, stats, blocks, progress)
+            if manifest:
+                if blocks is not None:
+                    manifest.save_blocks(blocks)
+                if checksums:
+                    manifest.save_hashes(checksums.cache)
+                manifest.save(SOURCE,      indexes[0])
+                manifest.save(DESTINATION, indexes[1])
+            return dict(stats.counters)
+        finally:
+            if checksums:
+                checksums.close()
+            for fs in [source_fs] + destination_fss:
+                if fs:
+                    fs.close()
+    except (ConnectionFailed, SSHException, IOError, OSError) as e:
+        raise SyncError(str(e))
+    finally:
+        if own_pool:
+            pool.close()
+        if manifest:
+            manifest.close()
+        for line in stats.summary():
+            _logger.debug(line)
+
+def watch(config, stats=None, debounce=1.0):
+    '''
+    Synchronizes config['source'], a local folder, into config['destinations'] once, then again every time changes are
+    made to it, until interrupted. Bursts of changes are coalesced, see sftpsync.watch.Watcher.changes(), and only the
+    folders in which they happened are compared again, over the same SSH connections.
+    Failed synchronizations are retried, along with the next changes, or after RETRY_DELAY seconds otherwise.
+    '''
+    from sftpsync.watch import Watcher
+    stats = stats or Stats()
+    pool = ConnectionPool(config, stats)
+    watcher = Watcher(config['source'], config['recursive'])  # Before the first synchronization, not to miss any change.
+    try:
+        folders = None  # Whole trees, the first time.
+        while True:
+            try:
+                sync(config, pool, stats, folders=folders)
+                folders = set()
+            except SyncError as e:
+                _logger.warning('Failed to synchronize: %s', e)
+            changed = watcher.changes(debounce, timeout=RETRY_DELAY if folders or folders is None else None)
+            _logger.debug('Changes in %s folder(s).', len(changed))
+            if folders is not None:
+                folders |= changed
+    finally:
+        watcher.close()
+        pool.close()
+
+def _list_folders(folders, fss, recursive=True, path_filter=None):
+    '''
+    Yields (folder, listings) tuples, as sftpsync.walker.walk_folders() does, for the provided folders only, parents
+    before their children. Folders missing from the source are skipped: their parent is expected to be listed as well.
+    So are folders excluded by path_filter, if provided.
+    '''
+    for folder in sorted(folders):
+        if path_filter is not None and path_filter.pruned(folder):
+            continue
+        listings = [_listdir(fs, folder) for fs in fss]
+        if listings[0] is None:
+            continue
+        yield folder, [filtered(folder, listing, recursive, path_filter) if listing is not None else None for listing in listings]
+
+def _listdir(fs, folder):
+    try:
+        return fs.listdir_attr(folder)
+    except (IOError, OSError):
+        return None
+
+def _cache(manifest, side, location):
+    '''
+    Only remote trees are worth indexing incrementally: listing local folders is cheap.
+    '''
+    return manifest.load(side) if manifest and isinstance(location, dict) else None
+
+def _compare(folders, destination_fss, config, stats, indexes=None, renames=None, checksums=None):
+    '''
+    Compares the (folder, [source listing, destination listing, ...]) tuples yielded by sftpsync.walker.walk_folders(),
+    one folder at a time, and yields a (path, source attributes, targets) tuple for each file to copy, targets being the
+    list of (destination index, destination attributes or None) pairs of the destinations needing it.
+    Missing folders are created, and, if config['delete'] is set, extraneous entries deleted, along the way. Partial
+    files left by interrupted copies of files still in the source are ignored, see sftpsync.transfer.copy_resumable().
+    If provided, indexes is a pair of dictionaries filled with the source's entries, and with the (only) destination's
+    entries as they will be once the synchronization is done.
+    If provided, renames (an sftpsync.renames.Renames) is handed the large files missing from the (only) destination, and
+    those to delete from it, so that the latter are moved to the former whenever they match. Their deletion, and the copy
+    of those without a match, are postponed until the whole trees have been compared, in case a match shows up later.
+    If provided, checksums (an sftpsync.checksums.Checksums) compares the content of files with the same size on both
+    sides, regardless of their modification times. Up to MAX_PENDING_CHECKSUMS comparisons are kept in flight, so that
+    files are hashed in parallel, while the trees are being walked.
+    '''
+    orphan_folders = []
+    comparisons = deque()  # (path, source attributes, destination attributes, comparison)
+    for folder, listings in folders:
+        source_entries = dict((_join(folder, a.filename), a) for a in listings[0])
+        copies = {}  # Path -> (source attributes, targets)
+        for i, (destination_fs, destination_listing) in enumerate(zip(destination_fss, listings[1:])):
+            if destination_listing is None and not folder:
+                destination_fs.mkdir('')
+            destination_entries = dict((_join(folder, a.filename), a) for a in destination_listing or () if partial_of(_join(folder, a.filename)) not in source_entries)
+            with stats.timer('diff'):
+                plan = planner.plan(source_entries, destination_entries, config['force'] or checksums is not None, config['preserve'])
+            for path in plan.folders:
+                destination_fs.mkdir(path)
+            stats.count('skipped', len(plan.skip))
+            if indexes is not None:
+                _record(indexes, plan, source_entries, destination_entries, config['delete'])
+            for path, attributes in plan.copy:
+                existing = destination_entries.get(path)
+                if checksums and not config['force'] and existing is not None and is_file(existing) and existing.st_size == attributes.st_size:
+                    comparisons.append((path, attributes, existing, checksums.compare(path)))
+                    continue
+                if renames and existing is None and attributes.st_size >= RENAME_MIN_SIZE:
+                    orphan = renames.added(path, attributes)
+                    if orphan:
+                        _rename(destination_fs, orphan, path, attributes, config, stats)
+                    continue
+                copies.setdefault(path, (attributes, []))[1].append((i, existing))
+            if config['delete']:
+                for path in plan.delete:
+                    if renames:
+                        _orphaned(renames, destination_fs, path, destination_entries[path], orphan_folders, config, stats)
+                    else:
+                        stats.count('deleted', _remove(destination_fs, path, destination_entries[path]))
+        for path, (attributes, targets) in copies.items():
+            yield path, attributes, targets
+        while comparisons and (comparisons[0][3].done() or len(comparisons) > MAX_PENDING_CHECKSUMS):
+            for task in _compared(comparisons.popleft(), config, stats):
+                yield task
+    while comparisons:
+        for task in _compared(comparisons.popleft(), config, stats):
+            yield task
+    if renames:
+        added, orphans = renames.unmatched()
+        for path, attributes in orphans + orphan_folders[::-1]:
+            stats.count('deleted', _remove(destination_fss[0], path, attributes))
+        for path, attributes in added:
+            yield path, attributes, [(0, None)]
+
+def _compared(comparison, config, stats):
+    '''
+    Yields the provided file, as a task for _transfer(), unless the comparison of its checksums found it up to date.
+    Files whose checksums could not be computed are compared by size and modification time instead.
+    '''
+    path, attributes, existing, comparison = comparison
+    same = comparison.result()
+    stats.count('checksummed')
+    if same is None:
+        same = planner.is_up_to_date(attributes, existing, config['preserve'])
+    if same:
+        stats.count('skipped')
+    else:
+        yield path, attributes, [(0, existing)]
+
+def _orphaned(renames, fs, path, attributes, folders, config, stats):
+    '''
+    Hands the provided destination entry, which is to be deleted, or the large files under it, to renames, moving those
+    matching a file added to the source. Other files are deleted right away, and folders added to the provided list, to
+    be deleted once the whole trees have been compared.
+    '''
+    if is_dir(attributes):
+        folders.append((path, attributes))
+        for child in fs.listdir_attr(path):
+            _orphaned(renames, fs, _join(path, child.filename), child, folders, config, stats)
+    elif is_file(attributes) and attributes.st_size >= RENAME_MIN_SIZE:
+        match = renames.orphaned(path, attributes)
+        if match:
+            _rename(fs, path, match[0], match[1], config, stats)
+    else:
+        stats.count('deleted', _remove(fs, path, attributes))
+
+def _rename(fs, path, new_path, attributes, config, stats):
+    _logger.debug('Moving %s to %s.', path, new_path)
+    fs.rename(path, new_path)
+    if config['preserve']:
+        _preserve(fs, new_path, attributes)
+    stats.count('renamed')
+
+def _record(indexes, plan, source_entries, destination_entries, delete):
+    '''
+    Adds the entries of the folder just compared to the provided (source index, destination index) pair, the latter
+    reflecting what the destination will contain once the provided plan has been executed.
+    Entries are stored as compact sftpsync.entries.Entry objects, as both indexes may cover millions of files.
+    '''
+    source_index, destination_index = indexes
+    for path, attributes in source_entries.items():
+        source_index[path] = entry(path, attributes)
+    for path, attributes in destination_entries.items():
+        destination_index[path] = entry(path, attributes)
+    for path in plan.folders:
+        destination_index[path] = source_index[path]
+    for path, _ in plan.copy:
+        destination_index[path] = source_index[path]
+    if delete:
+        for path in plan.delete:
+            del destination_index[path]
+
+def _transfer(tasks, source, destinations, config, stats, blocks=None, progress=None):
+    '''
+    Copies the files yielded by tasks, as (path, source attributes, targets) tuples (see _compare()), using
+    config['jobs'] workers, fed through a bounded queue: tasks is only consumed as fast as files are copied.
+    Files already present on the destination are updated using delta transfers if config['delta'] is set. blocks maps
+    paths to the block hashes recorded for them, see Manifest.load_blocks(): if provided, it is updated with the hashes of
+    the files written to a remote destination.
+    If provided, progress is told about each file found, and about each block transferred.
+    If config['adaptive'] is set, the number of files transferred at the same time, and of requests in flight for each
+    of them, are adjusted by a Scheduler, up to config['jobs'] and config['window'], and failed files are retried
+    (after backing off) up to RETRIES times, to the destinations they failed for. If config['bwlimit'] is set, the overall
+    throughput is capped to that many bytes per second.
+    If config['tar'] is set, small files are sent in batches, as tar archives extracted on the server, see
+    sftpsync.archive.push(), falling back to SFTP for the batches which could not be sent that way.
+    '''
+    queue = Queue(maxsize=2 * config['jobs'])
+    errors = []
+    lock = Lock()
+    scheduler = Scheduler(config['jobs'], config['window'], config['adaptive'])
+    bucket = TokenBucket(config['bwlimit']) if config['bwlimit'] else None
+    retries = RETRIES if config['adaptive'] else 0
+    locations = config.get('destinations', [config['destination']])
+    refused = []  # Set once the server refused to run tar.
+
+    def describe(path, i):
+        return path if len(locations) == 1 else '%s on %s' % (path, locations[i].get('host'))
+
+    def copy_file(path, attributes, targets, instances, callback):
+        for attempt in range(retries + 1):
+            try:
+                with scheduler:
+                    instances[None] = instances.get(None) or source()
+                    for i, _ in targets:
+                        instances[i] = instances.get(i) or destinations[i]()
+                    with stats.timer('transfer'):
+                        failures = _copy_to(targets, source, destinations, instances[None], instances, path, attributes, blocks, config, stats, callback, scheduler.window)
+            except (IOError, OSError, SSHException, ConnectionFailed) as e:
+                failures = [(target, e) for target in targets]
+            if not failures:
+                return
+            scheduler.failed()
+            for fs in [instances.pop(None, None)] + [instances.pop(i, None) for (i, _), _ in failures]:
+                if fs:
+                    fs.close()
+            targets = [target for target, _ in failures]
+            if attempt < retries:
+                for (i, _), e in failures:
+                    _logger.warning('Failed to copy %s: %s. Retrying.', describe(path, i), e)
+                stats.count('retries', len(failures))
+                continue
+            for (i, _), e in failures:
+                _logger.warning('Failed to copy %s: %s', describe(path, i), e)
+                stats.count('errors')
+                with lock:
+                    errors.append((describe(path, i), e))
+
+    def send_batch(batch, instances, callback):
+        '''
+        Sends the provided batch of small files to the (only) destination as a single tar archive, and returns whether it
+        succeeded: if not, the files are to be copied one by one over SFTP instead.
+        '''
+        if refused:
+            return False
+        try:
+            with scheduler:
+                instances[None] = instances.get(None) or source()
+                instances[0] = instances.get(0) or destinations[0]()
+                with stats.timer('transfer'):
+                    size = archive.push(instances[None], instances[0], [(path, attributes) for path, attributes, _ in batch], config['preserve'], config['block_size'], callback)
+        except archive.ExecRefused as e:
+            if not refused:
+                _logger.warning('Cannot run tar on the server: %s. Falling back to SFTP.', e)
+            refused.append(e)
+            return False
+        except (IOError, OSError, SSHException, ConnectionFailed, archive.ArchiveFailed) as e:
+            _logger.warning('Failed to send %s file(s) as an archive: %s. Falling back to SFTP.', len(batch), e)
+            for fs in (instances.pop(None, None), instances.pop(0, None)):
+                if fs:
+                    fs.close()
+            return False
+        _logger.debug('Sent %s file(s) (%s bytes) as an archive.', len(batch), size)
+        stats.count('archives')
+        stats.count('copied', len(batch))
+        stats.count('bytes', size)
+        return True
+
+    def worker():
+        instances = {}  # None for the source, destination index otherwise -> file system object.
+        try:
+            for task in iter(queue.get, None):
+                batch = task if isinstance(task, list) else [task]
+                size = sum(attributes.st_size * len(targets) for _, attributes, targets in batch)
+                with (progress.transfer(size, len(batch)) if progress else nullcontext()) as progress_callback:
+                    callback = _callback(scheduler, bucket, progress_callback)
+                    if isinstance(task, list) and send_batch(task, instances, callback):
+                        continue
+                    for path, attributes, targets in batch:
+                        copy_file(path, attributes, targets, instances, callback)
+        finally:
+            for fs in instances.values():
+                fs.close()
+
+    workers = [Thread(target=worker) for _ in range(config['jobs'])]
+    for thread in workers:
+        thread.daemon = True
+        thread.start()
+    try:
+        batch, batch_size = [], 0
+        for task in tasks:
+            path, attributes, targets = task
+            if progress:
+                progress.queued(attributes.st_size * len(targets))
+            if not (config['tar'] and not refused and archive.eligible(attributes, targets[0][1], config)):
+                queue.put(task)
+                continue
+            batch.append(task)
+            batch_size += attributes.st_size
+            if len(batch) >= archive.MAX_BATCH_FILES or batch_size >= archive.MAX_BATCH_SIZE:
+                queue.put(batch)
+                batch, batch_size = [], 0
+        if batch:
+            queue.put(batch)
+        if progress:
+            progress.done_walking()
+    finally:
+        for _ in workers:
+            queue.put(None)
+        for thread in workers:
+            thread.join()
+    if errors:
+        raise SyncError('Failed to synchronize %s file(s): %s' % (len(errors), ', '.join('%s (%s)' % (path, e) for path, e in errors)))
+
+def _callback(scheduler, bucket, progress):
+    '''
+    Returns the function to call with the size of each block transferred, or None if nothing needs to know.
+    '''
+    if not (scheduler.adaptive or bucket or progress):
+        return None
+
+    def callback(n):
+        if bucket:
+            bucket.take(n)
+        scheduler.transferred(n)
+        if progress:
+            progress(n)
+    return callback
+
+def _copy_to(targets, source, destinations, source_fs, destination_fss, path, attributes, blocks, config, stats, callback=None, window=None):
+    '''
+    Copies the file at the provided path to the provided targets, and returns the list of (target, exception) pairs of
+    those it failed to be copied to. A file needed by several destinations is read only once, see fan_out().
+    '''
+    if len(targets) == 1:
+        (i, existing), = targets
+        try:
+            size = _copy(source, destinations[i], source_fs, destination_fss[i], path, attributes, existing, blocks, config, callback, window)
+        except (IOError, OSError, SSHException, ConnectionFailed) as e:
+            return [(targets[0], e)]
+        stats.count('copied')
+        stats.count('bytes', size)
+        return []
+    _logger.debug('Copying %s (%s bytes) to %s destinations.', path, attributes.st_size, len(targets))
+    results = fan_out(source_fs, [destination_fss[i] for i, _ in targets], path, attributes, config['preserve'], config['block_size'], window or config['window'], callback)
+    failures = []
+    for target, result in zip(targets, results):
+        if isinstance(result, Exception):
+            failures.append((target, result))
+        else:
+            stats.count('copied')
+            stats.count('bytes', result)
+    return failures
+
+def _copy(source, destination, source_fs, destination_fs, path, attributes, existing, blocks, config, callback=None, window=None):
+    window = window or config['window']
+    if config['delta'] and existing is not None and is_file(existing):
+        recorded = blocks.get(path) if blocks is not None else None
+        known = recorded[2] if recorded and recorded[:2] == (existing.st_size, int(existing.st_mtime)) else None
+        result = copy_delta(source_fs, destination_fs, path, attributes, known, config['preserve'], config['block_size'], window, callback)
+        if result is not None:
+            _logger.debug('Updated %s: %s of %s bytes sent.', path, result[0], attributes.st_size)
+            _record_blocks(destination_fs, path, result[1], blocks)
+            return result[0]
+    _logger.debug('Copying %s (%s bytes).', path, attributes.st_size)
+    if config['stripes'] > 1 and attributes.st_size >= 2 * MIN_STRIPE_SIZE:
+        size = copy_ranges(source, destination, path, attributes, config['stripes'], config['preserve'], config['block_size'], window, callback)
+    elif attributes.st_size >= RESUMABLE_SIZE:
+        size = copy_resumable(source_fs, destination_fs, path, attributes, config['preserve'], config['block_size'], window, callback, restart=config['force'])
+    else:
+        size = copy(source_fs, destination_fs, path, attributes, config['preserve'], config['block_size'], window, callback)
+    if config['delta'] and blocks is not None:
+        with source_fs.open(path, 'rb') as f:
+            _record_blocks(destination_fs, path, block_hashes(f), blocks)
+    return size
+
+def _record_blocks(fs, path, hashes, blocks):
+    '''
+    Records the block hashes of the file just written to the destination, along with its actual size and modification
+    time, so that they can be trusted on the next run as long as the file is left untouched.
+    '''
+    if blocks is None or hashes is None:
+        return
+    attributes = fs.stat(path)
+    blocks[path] = (attributes.st_size, int(attributes.st_mtime), hashes)
+
+def _remove(fs, path, attributes):
+    '''
+    Removes the provided file or folder, along with the folder's content, and returns the number of entries removed.
+    '''
+    removed = 1
+    if is_dir(attributes):
+        for child in fs.listdir_attr(path):
+            removed += _remove(fs, _join(path, child.filename), child)
+    _logger.debug('Deleting %s.', path)
+    if is_dir(attributes):
+        fs.rmdir(path)
+    else:
+        fs.remove(path)
+    return removed
+
+def _file_system_factory(location, pool, stats):
     '''
-    Returns an SSHConfig object containing dictionaries for each hostname.
-    Each dictionary contains at least {'hostname': <host>}.
-    If ~/.ssh/config is present and contains some directives, it will parse them and add the relevant fields to the dictionnary.
-    If provided path does not exist, an empty SSHConfig is returned.
+    Returns a function creating a new file system object for the provided location every time it is called, timed
+    using the provided Stats.
+    For remote locations, each of them gets its own SFTP channel, or FTP control connection, from the provided pool, which
+    it hands back once closed.
     '''
-    ssh_config = SSHConfig()
-    if os.path.isfile(path):
-        with open(path) as f:
-            ssh_config.parse(f)
-    return ssh_config
+    if not isinstance(location, dict):
+        return lambda: TimedFileSystem(LocalFileSystem(location), stats)
+    if is_ftp(location):
+        return lambda: TimedFileSystem(FTPFileSystem(pool.ftp(location), location.get('path', '/'), release=lambda ftp: pool.release(location, ftp)), stats)
+    return lambda: TimedFileSystem(RemoteFileSystem(pool.channel(location), location.get('path', '/'), release=lambda sftp: pool.release(location, sftp)), stats)
@@ -0,0 +1,294 @@
+import json
+import posixpath
+from threading import Thread
+from queue import Queue
+from paramiko import SFTPFile
+from sftpsync.buffers import pooled
+
+
+MIN_STRIPE_SIZE     = 16 * 1024 * 1024
+RESUMABLE_SIZE      = 32 * 1024 * 1024  # Smaller files are written in place, see copy_resumable().
+CHECKPOINT_INTERVAL = 16 * 1024 * 1024
+TAIL_SIZE           = 64 * 1024
+
+def copy(source_fs, destination_fs, path, attributes, preserve=False, block_size=32768, window=64, callback=None):
+    '''
+    Copies the file at the provided path from source_fs to destination_fs, block_size bytes at a time.
+    Remote reads and writes are pipelined: up to window read requests are kept in flight, and writes are sent without
+    waiting for each reply, so that the link's latency is not paid once per block. Local files are read into a buffer
+    taken from a shared pool, see sftpsync.buffers, rather than into a new bytes object per block.
+    If preserve is True, the modification time, access time and mode of the original file are also applied to the copy.
+    If provided, callback is called with the size of each block written.
+    Returns the number of bytes copied.
+    '''
+    copied = 0
+    with source_fs.open(path, 'rb') as source:
+        with destination_fs.open(path, 'wb') as destination, pooled(block_size) as buffers:
+            if isinstance(destination, SFTPFile):
+                destination.set_pipelined(True)
+            for data in _blocks(source, 0, attributes.st_size, block_size, window, buffers):
+                destination.write(data)
+                copied += len(data)
+                if callback:
+                    callback(len(data))
+    if preserve:
+        _preserve(destination_fs, path, attributes)
+    return copied
+
+def copy_ranges(source, destination, path, attributes, stripes, preserve=False, block_size=32768, window=64, callback=None):
+    '''
+    Copies the file at the provided path, split into up to stripes byte ranges of at least MIN_STRIPE_SIZE bytes, all
+    transferred at the same time. A partial file, see partial_paths(), is first preallocated, and each range is then
+    written at its offset by its own thread, over its own file system object, as created by the provided source and
+    destination functions (for remote locations: its own SFTP channel). The partial file replaces the destination once
+    all ranges were copied, and is removed otherwise: a failed copy never leaves a file of the right size with holes.
+    Returns the number of bytes copied.
+    '''
+    ranges = _ranges(attributes.st_size, stripes)
+    partial = partial_paths(path)[0]
+    destination_fs = destination()
+    try:
+        with destination_fs.open(partial, 'wb') as f:
+            f.truncate(attributes.st_size)
+        copied, errors = [], []
+
+        def worker(offset, length):
+            try:
+                copied.append(_copy_range(source, destination, path, partial, offset, length, block_size, window, callback))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [Thread(target=worker, args=r) for r in ranges]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            _discard(destination_fs, partial)
+            raise errors[0]
+        if preserve:
+            _preserve(destination_fs, partial, attributes)
+        destination_fs.replace(partial, path)
+        return sum(copied)
+    finally:
+        destination_fs.close()
+
+def copy_resumable(source_fs, destination_fs, path, attributes, preserve=False, block_size=32768, window=64, callback=None, restart=False, interval=CHECKPOINT_INTERVAL):
+    '''
+    Same as copy(), except that the file is first written to a partial file next to its destination, see partial_paths(),
+    which replaces the destination once complete. Every interval bytes, the partial file is closed, so that all writes
+    to it are acknowledged, and reopened once a checkpoint records the source's size and modification time, and how many
+    bytes were written: if the copy gets interrupted, the next copy of the same version of the file resumes from there,
+    unless restart is True, once the TAIL_SIZE bytes before it have been checked to match the source.
+    Returns the number of bytes copied, i.e. not counting those already written before resuming.
+    '''
+    partial, checkpoint = partial_paths(path)
+    offset = 0 if restart else _resume_offset(source_fs, destination_fs, path, attributes)
+    copied = 0
+    with source_fs.open(path, 'rb') as source, pooled(block_size) as buffers:
+        destination = _open_partial(destination_fs, partial, offset, truncate=True)
+        try:
+            _checkpoint(destination_fs, checkpoint, attributes, offset)
+            for data in _blocks(source, offset, attributes.st_size - offset, block_size, window, buffers):
+                destination.write(data)
+                copied += len(data)
+                if callback:
+                    callback(len(data))
+                if copied % interval < len(data):
+                    # Closing the partial file waits for the replies to all its pipelined writes: only then are they
+                    # known to have succeeded, and can another file be opened over the same SFTP channel.
+                    destination.close()
+                    _checkpoint(destination_fs, checkpoint, attributes, offset + copied)
+                    destination = _open_partial(destination_fs, partial, offset + copied)
+        finally:
+            destination.close()
+    if preserve:
+        _preserve(destination_fs, partial, attributes)
+    destination_fs.replace(partial, path)
+    destination_fs.remove(checkpoint)
+    return copied
+
+def partial_paths(path):
+    '''
+    Returns the paths of the partial file, and of its checkpoint, used by copy_resumable() to write the provided file.
+    '''
+    folder, name = posixpath.split(path)
+    return posixpath.join(folder, '.%s.partial' % name), posixpath.join(folder, '.%s.checkpoint' % name)
+
+def partial_of(path):
+    '''
+    Returns the path of the file the provided partial file, or checkpoint, is written for, or None if it is neither.
+    '''
+    folder, name = posixpath.split(path)
+    for suffix in ('.partial', '.checkpoint'):
+        if name.startswith('.') and name.endswith(suffix) and len(name) > len(suffix) + 1:
+            return posixpath.join(folder, name[1:-len(suffix)])
+    return None
+
+def _resume_offset(source_fs, destination_fs, path, attributes):
+    partial, checkpoint = partial_paths(path)
+    try:
+        with destination_fs.open(checkpoint, 'rb') as f:
+            recorded = json.loads(f.read().decode('utf-8'))
+        offset = min(recorded['offset'], destination_fs.stat(partial).st_size)
+        if (recorded['size'], recorded['mtime']) != (attributes.st_size, int(attributes.st_mtime)):
+            return 0
+        tail = min(offset, TAIL_SIZE)
+        if tail and _tail(source_fs, path, offset, tail) != _tail(destination_fs, partial, offset, tail):
+            return 0
+        return offset
+    except (IOError, OSError, ValueError, KeyError, TypeError):
+        return 0
+
+def _open_partial(fs, partial, offset, truncate=False):
+    f = fs.open(partial, 'r+b' if offset else 'wb')
+    if offset:
+        if truncate:
+            f.truncate(offset)
+        f.seek(offset)
+    if isinstance(f, SFTPFile):
+        f.set_pipelined(True)
+    return f
+
+def _tail(fs, path, offset, length):
+    with fs.open(path, 'rb') as f:
+        return b''.join(_read(f, offset - length, length, length))
+
+def _checkpoint(fs, path, attributes, offset):
+    with fs.open(path, 'wb') as f:
+        f.write(json.dumps({'size': attributes.st_size, 'mtime': int(attributes.st_mtime), 'offset': offset}).encode('utf-8'))
+
+def fan_out(source_fs, destination_fss, path, attributes, preserve=False, block_size=32768, window=64, callback=None, lag=64):
+    '''
+    Copies the file at the provided path from source_fs to all destination_fss at the same time, reading it only once:
+    each block read is shared by the destinations, each of them written by its own thread. A slow destination may lag
+    behind the others by up to lag blocks, after which reading waits for it. Local files are read into lag + 2 pooled
+    buffers used in turn: once block n is queued for all destinations, each of them has at least taken block n - lag,
+    hence is done with block n - lag - 1, whose buffer block n + 1 is read into.
+    If provided, callback is called with the size of each block written, to each destination.
+    Returns, for each destination, the number of bytes copied, or the exception which made the copy to it fail.
+    Exceptions raised while reading the source are raised as is.
+    '''
+    queues  = [Queue(maxsize=lag) for _ in destination_fss]
+    results = [0] * len(destination_fss)
+    read    = []
+
+    def writer(i):
+        try:
+            with destination_fss[i].open(path, 'wb') as destination:
+                if isinstance(destination, SFTPFile):
+                    destination.set_pipelined(True)
+                for data in iter(queues[i].get, None):
+                    destination.write(data)
+                    results[i] += len(data)
+                    if callback:
+                        callback(len(data))
+            if preserve and read:
+                _preserve(destination_fss[i], path, attributes)
+        except Exception as e:
+            results[i] = e
+            for _ in iter(queues[i].get, None):  # So that reading does not wait for this destination.
+                pass
+
+    threads = [Thread(target=writer, args=(i,)) for i in range(len(destination_fss))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    with pooled(block_size, lag + 2) as buffers:  # Only released once all writers are done with them.
+        try:
+            with source_fs.open(path, 'rb') as source:
+                for data in _blocks(source, 0, attributes.st_size, block_size, window, buffers):
+                    for queue in queues:
+                        queue.put(data)
+            read.append(True)
+        finally:
+            for queue in queues:
+                queue.put(None)
+            for thread in threads:
+                thread.join()
+    return results
+
+def _ranges(size, stripes):
+    count  = max(1, min(stripes, size // MIN_STRIPE_SIZE))
+    length = -(-size // count)
+    return [(offset, min(length, size - offset)) for offset in range(0, size, length)] if size else [(0, 0)]
+
+def _copy_range(source, destination, path, target, offset, length, block_size, window, callback=None):
+    copied = 0
+    source_fs, destination_fs = source(), destination()
+    try:
+        with source_fs.open(path, 'rb') as reader:
+            with destination_fs.open(target, 'r+b') as writer, pooled(block_size) as buffers:
+                if isinstance(writer, SFTPFile):
+                    writer.set_pipelined(True)
+                writer.seek(offset)
+                for data in _blocks(reader, offset, length, block_size, window, buffers):
+                    writer.write(data)
+                    copied += len(data)
+                    if callback:
+                        callback(len(data))
+        return copied
+    finally:
+        source_fs.close()
+        destination_fs.close()
+
+def _discard(fs, path):
+    try:
+        fs.remove(path)
+    except (IOError, OSError):
+        pass
+
+def _preserve(fs, path, attributes):
+    fs.utime(path, (attributes.st_atime or attributes.st_mtime, attributes.st_mtime))
+    fs.chmod(path, attributes.st_mode & 0o7777)
+
+def _blocks(source, offset, length, block_size, window, buffers=None):
+    '''
+    Yields the content of the provided file, from offset and up to length bytes.
+    Local files are read into the provided buffers, if any, see _read_into().
+    '''
+    if not isinstance(source, SFTPFile):
+        if buffers:
+            return _read_into(source, offset, length, buffers)
+        return _read(source, offset, length, block_size)
+    if offset == 0:
+        try:
+            source.prefetch(length, max_concurrent_requests=window)
+            return _read(source, offset, length, block_size)
+        except TypeError:  # paramiko < 3.3 would request the whole file at once, which is unbounded for huge files.
+            pass
+    return _windowed_readv(source, offset, length, window)
+
+def _read(source, offset, length, block_size):
+    source.seek(offset)
+    while length > 0:
+        data = source.read(min(block_size, length))
+        if not data:
+            return
+        length -= len(data)
+        yield data
+
+def _read_into(source, offset, length, buffers):
+    '''
+    Same as _read(), except that blocks are read into the provided buffers, used in turn, and yielded as memoryviews of
+    them, without any copy: each block is only valid until as many more blocks as there are buffers were yielded.
+    '''
+    views = [memoryview(buffer) for buffer in buffers]
+    source.seek(offset)
+    i = 0
+    while length > 0:
+        view = views[i % len(views)]
+        read = source.readinto(view[:min(len(view), length)])
+        if not read:
+            return
+        length -= read
+        i += 1
+        yield view[:read]
+
+def _windowed_readv(source, offset, length, window):
+    batch = window * source.MAX_REQUEST_SIZE
+    end   = offset + length
+    for start in range(offset, end, batch):
+        for data in source.readv([(start, min(batch, end - start))]):
+            yield data
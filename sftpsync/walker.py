@@ -0,0 +1,152 @@
+import posixpath
+from threading import Thread, Event
+from queue import Queue, Full
+from sftpsync.filesystem import is_dir
+
+
+def walk(file_system, recursive=True, jobs=8, cache=None, path_filter=None):
+    '''
+    Yields (relative path, attributes) tuples for all entries of a tree, parents before their children, as soon as the
+    listing of their folder arrives. See walk_folders().
+    '''
+    for folder, (listing,) in walk_folders([file_system], recursive, jobs, [cache], path_filter):
+        for attributes in listing:
+            yield _join(folder, attributes.filename), attributes
+
+def walk_folders(file_systems, recursive=True, jobs=8, caches=None, path_filter=None):
+    '''
+    Walks the tree of the first of the provided file systems, and yields a (relative path, listings) tuple for each of its
+    folders, parents before their children, as soon as the folder has been listed on all file systems. listings contains,
+    for each file system, the attributes of the folder's entries, or None if the folder does not exist on it. Errors
+    listing the first file system, including its root folder, are raised: its tree is never taken as empty, or
+    partial, which would get the other trees' content deleted when synchronizing with deletions. So are errors other than
+    IOError and OSError on any file system, e.g. failures to connect to it.
+    Up to jobs folders are listed at the same time, each worker using its own file system objects, as created by calling
+    file_systems (for remote locations: its own SFTP channels). At most a few listings are buffered, ahead of the
+    consumer: memory remains bounded by the width of the tree being walked, whatever its size.
+    Unless recursive is True, only the files directly under the root folder are listed.
+    If caches are provided (e.g. as loaded from a Manifest), folders whose modification time did not change since they
+    were recorded are not listed again: their entries are taken from the cache instead. Subfolders of such folders are
+    then only checked (stat), as their own modification time in the cache may be out of date, and listed if it is.
+    If provided, path_filter (an sftpsync.filters.Filter) removes excluded entries from listings, and excluded folders are
+    never listed, on any file system.
+    '''
+    caches   = caches or [None] * len(file_systems)
+    children = [_children(cache) if cache else {} for cache in caches]
+    folders, listings = Queue(), Queue(maxsize=2 * jobs)
+    stopped = Event()
+
+    def worker():
+        instances = {}
+        try:
+            while True:
+                job = folders.get()
+                if job is None or stopped.is_set():
+                    return
+                folder, i, cached = job
+                try:
+                    if i not in instances:
+                        instances[i] = file_systems[i]()
+                    if cached is not None and int(instances[i].stat(folder).st_mtime) == int(cached[0].st_mtime):
+                        result = (folder, i, cached[1], True, None)
+                    else:
+                        result = (folder, i, instances[i].listdir_attr(folder), False, None)
+                except Exception as e:  # Handed over to the consumer, which would otherwise wait for this listing forever.
+                    result = (folder, i, None, False, e)
+                while not stopped.is_set():
+                    try:
+                        listings.put(result, timeout=0.1)
+                        break
+                    except Full:
+                        pass
+        finally:
+            for fs in instances.values():
+                fs.close()
+
+    workers = [Thread(target=worker) for _ in range(jobs)]
+    for thread in workers:
+        thread.daemon = True
+        thread.start()
+    try:
+        n = len(file_systems)
+        waiting = {'': [[None] * n, [False] * n, n]}  # Folder -> [listings, taken from the caches, listings still expected]
+        for i in range(n):
+            folders.put(('', i, None))
+        pending = n
+        ready = []
+        while pending or ready:
+            if not ready:
+                folder, i, listing, reused, error = listings.get()
+                pending -= 1
+                if error is not None and (i == 0 or not isinstance(error, (IOError, OSError))):
+                    raise error
+                state = waiting[folder]
+                if listing is not None:
+                    state[0][i] = listing if reused else filtered(folder, listing, recursive, path_filter)
+                    state[1][i] = reused
+                state[2] -= 1
+                if state[2]:
+                    continue
+                del waiting[folder]
+                ready.append((folder, state[0], state[1]))
+            folder, folder_listings, folder_reused = ready.pop()
+            for subfolder, subfolder_listings, subfolder_reused, needed in _subfolders(folder, folder_listings, folder_reused, caches, children, path_filter):
+                if needed:
+                    waiting[subfolder] = [subfolder_listings, subfolder_reused, len(needed)]
+                    for i, cached in needed:
+                        folders.put((subfolder, i, cached))
+                        pending += 1
+                else:
+                    ready.append((subfolder, subfolder_listings, subfolder_reused))
+            yield folder, folder_listings
+    finally:
+        stopped.set()
+        for _ in workers:
+            folders.put(None)
+
+def filtered(folder, listing, recursive=True, path_filter=None):
+    '''
+    Returns the entries of the provided listing of folder which are included by path_filter, if any, and, unless
+    recursive is True, which are not folders.
+    '''
+    return [a for a in listing if (recursive or not is_dir(a)) and (path_filter is None or path_filter.included(_join(folder, a.filename), is_dir(a)))]
+
+def _subfolders(folder, listings, reused, caches, children, path_filter=None):
+    '''
+    Yields a (relative path, listings, reused, jobs) tuple for each subfolder of the provided folder on the first file
+    system, reused telling which listings were taken from the caches, and jobs being the (file system index, cached)
+    pairs of the listings still to get. Subfolders whose own entry was taken from a cache are checked before being
+    listed: cached is then the (cached attributes, cached listing) pair to use if their modification time did not change.
+    Listings are None for the subfolders missing from a file system, or still to get.
+    '''
+    entries = [dict((a.filename, a) for a in listing) if listing is not None else {} for listing in listings]
+    for attributes in listings[0]:
+        if not is_dir(attributes):
+            continue
+        path = _join(folder, attributes.filename)
+        subfolder_listings, subfolder_reused, needed = [None] * len(listings), [False] * len(listings), []
+        for i in range(len(listings)):
+            entry = entries[i].get(attributes.filename)
+            if entry is None or not is_dir(entry):
+                continue
+            cached = caches[i].get(path) if caches[i] else None
+            if cached is None or not is_dir(cached):
+                needed.append((i, None))
+                continue
+            listing = filtered(path, [caches[i][child] for child in children[i].get(path, ())], True, path_filter)
+            if reused[i]:  # The subfolder's entry comes from the cache as well: its modification time is checked first.
+                needed.append((i, (cached, listing)))
+            elif int(cached.st_mtime) == int(entry.st_mtime):
+                subfolder_listings[i], subfolder_reused[i] = listing, True
+            else:
+                needed.append((i, None))
+        yield path, subfolder_listings, subfolder_reused, needed
+
+def _children(entries):
+    children = {}
+    for path in entries:
+        children.setdefault(posixpath.dirname(path), []).append(path)
+    return children
+
+def _join(folder, name):
+    return posixpath.join(folder, name) if folder else name
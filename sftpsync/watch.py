@@ -0,0 +1,123 @@
+import os
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+from sftpsync.walker import _join
+
+
+# See inotify(7).
+IN_ATTRIB      = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM  = 0x00000040
+IN_MOVED_TO    = 0x00000080
+IN_CREATE      = 0x00000100
+IN_DELETE      = 0x00000200
+IN_Q_OVERFLOW  = 0x00004000
+IN_IGNORED     = 0x00008000
+IN_ONLYDIR     = 0x01000000
+IN_ISDIR       = 0x40000000
+
+# Files are only reported once closed after being written, rather than on every write, or when created.
+_MASK  = IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_ONLYDIR
+_EVENT = struct.Struct('iIII')  # Watch descriptor, mask, cookie, length of the name which follows.
+
+class Watcher(object):
+    '''
+    Follows changes made to the local folder at the provided root, and, unless recursive is False, to its subfolders,
+    using Linux's inotify: see changes().
+    Watches are added to folders created, or moved, under the root as soon as they are reported, and all the folders of
+    their trees reported as changed, so that files created in them before their watch was added are not missed.
+    '''
+    def __init__(self, root, recursive=True):
+        self._root      = root
+        self._recursive = recursive
+        self._libc      = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._fd        = self._libc.inotify_init1(os.O_CLOEXEC)
+        if self._fd < 0:
+            _raise()
+        self._folders   = {}  # Watch descriptor -> folder, relative to root.
+        self._watch('')
+
+    def close(self):
+        os.close(self._fd)
+
+    def changes(self, debounce=1.0, timeout=None, maximum=None):
+        '''
+        Waits for changes, then until debounce seconds went by without any, so that bursts of events are coalesced, and
+        returns the set of folders, relative to the root, in which they happened. Waits for at most maximum seconds,
+        ten times debounce by default, once the first change happened, and at most timeout seconds, if provided, for it:
+        the returned set is then empty.
+        '''
+        maximum = maximum if maximum is not None else 10 * debounce
+        changed, started, wait = set(), None, timeout
+        while True:
+            ready, _, _ = select.select([self._fd], [], [], wait)
+            if ready:
+                changed.update(self._read())
+            if changed and started is None:
+                started = time.time()
+            if (not ready and (changed or timeout is not None)) or (started is not None and time.time() - started >= maximum):
+                return changed
+            if changed:
+                wait = max(0, min(debounce, started + maximum - time.time()))
+
+    def _read(self):
+        data = os.read(self._fd, 64 * 1024)
+        changed = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, offset)
+            name = os.fsdecode(data[offset + _EVENT.size:offset + _EVENT.size + length].rstrip(b'\0'))
+            offset += _EVENT.size + length
+            if mask & IN_Q_OVERFLOW:  # Events were lost: everything may have changed.
+                changed.update(self._folders.values())
+                continue
+            folder = self._folders.get(wd)
+            if mask & IN_IGNORED:
+                self._folders.pop(wd, None)
+            if folder is None or mask & IN_IGNORED:
+                continue
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO | IN_MOVED_FROM | IN_DELETE):
+                if mask & (IN_MOVED_FROM | IN_DELETE):
+                    self._unwatch(_join(folder, name))
+                elif self._recursive:
+                    changed.update(self._watch(_join(folder, name)))
+            elif mask & IN_CREATE:  # Files are reported once written.
+                continue
+            changed.add(folder)
+        return changed
+
+    def _watch(self, folder):
+        '''
+        Watches the provided folder and, if recursive, its subfolders, and returns the list of those watched.
+        '''
+        path = os.path.join(self._root, *folder.split('/')) if folder else self._root
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), _MASK)
+        if wd < 0:
+            if ctypes.get_errno() in (errno.ENOENT, errno.ENOTDIR):  # Deleted, or replaced, in the meantime.
+                return []
+            _raise()
+        self._folders[wd] = folder
+        watched = [folder]
+        if self._recursive:
+            try:
+                for entry in os.scandir(path):
+                    if entry.is_dir():
+                        watched.extend(self._watch(_join(folder, entry.name)))
+            except OSError:
+                pass
+        return watched
+
+    def _unwatch(self, folder):
+        for wd, watched in list(self._folders.items()):
+            if watched == folder or watched.startswith(folder + '/'):
+                self._libc.inotify_rm_watch(self._fd, wd)
+                del self._folders[wd]
+
+
+def _raise():
+    code = ctypes.get_errno()
+    raise OSError(code, os.strerror(code))
@@ -0,0 +1,30 @@
+from unittest2 import TestCase, main
+from sftpsync.buffers import BufferPool, pool, pooled
+
+
+class BuffersTest(TestCase):
+
+    def test_released_buffers_are_reused(self):
+        buffers = BufferPool(16)
+        first = buffers.acquire(3)
+        self.assertEqual([len(buffer) for buffer in first], [16, 16, 16])
+        buffers.release(first)
+        self.assertEqual(len(buffers), 3)
+        second = buffers.acquire(4)
+        self.assertEqual(len(buffers), 0)
+        self.assertEqual(sum(1 for buffer in second if any(buffer is b for b in first)), 3)
+
+    def test_pool_size_is_bounded(self):
+        buffers = BufferPool(16, size=2)
+        buffers.release(buffers.acquire(3))
+        self.assertEqual(len(buffers), 2)
+
+    def test_pooled(self):
+        with pooled(12345, 2) as buffers:
+            self.assertEqual(len(pool(12345)), 0)
+        self.assertEqual(len(pool(12345)), 2)
+        with pooled(12345) as others:
+            self.assertTrue(others[0] is buffers[1])
+
+if __name__ == '__main__':
+    main()
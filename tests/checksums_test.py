@@ -0,0 +1,93 @@
+from unittest2 import TestCase, main
+from tests.test_utilities import TempFolder, write_file
+import os
+import threading
+from hashlib import md5
+from sftpsync.filesystem import LocalFileSystem
+from sftpsync.checksums import Checksums, digest
+import sftpsync.checksums
+
+
+class FakeRemoteFileSystem(object):
+    '''
+    Local folder standing in for a remote one, whose files are hashed "by the server" (unless it cannot, in which case
+    check() fails), recording the threads asking for it.
+    '''
+    threads = set()
+    def __init__(self, folder, can_hash=True):
+        self._fs, self._can_hash = LocalFileSystem(folder), can_hash
+    def open(self, path, mode='rb'):
+        f = self._fs.open(path, mode)
+        def check(*args):
+            if not self._can_hash:
+                raise IOError('Operation unsupported.')
+            self.threads.add(threading.current_thread())
+            return md5(f.read()).digest()
+        f.check = check
+        return f
+    def close(self):
+        pass
+
+class ChecksumsTest(TestCase):
+
+    def test_digest(self):
+        with TempFolder() as folder:
+            content = os.urandom(100000)
+            self.assertEqual(digest(write_file(folder, 'a.bin', content)), md5(content).hexdigest())
+            self.assertEqual(digest(write_file(folder, 'empty.bin', b'')), md5(b'').hexdigest())
+
+    def test_compare(self):
+        with TempFolder() as source, TempFolder() as destination:
+            content = os.urandom(100000)
+            write_file(source, 'same.bin', content, mtime=1000000000)
+            write_file(destination, 'same.bin', content, mtime=2000000000)
+            write_file(source, 'different.bin', b'a' * 1000)
+            write_file(destination, 'different.bin', b'b' * 1000)
+            original, sftpsync.checksums.MIN_POOLED_SIZE = sftpsync.checksums.MIN_POOLED_SIZE, 50000
+            checksums = Checksums(source, lambda: LocalFileSystem(source), destination, lambda: LocalFileSystem(destination), processes=2)
+            try:
+                self.assertEqual(checksums.compare('same.bin').result(), True)
+                self.assertEqual(checksums.compare('different.bin').result(), False)
+            finally:
+                checksums.close()
+                sftpsync.checksums.MIN_POOLED_SIZE = original
+            self.assertEqual(sorted(checksums.cache.values()), sorted([md5(content).hexdigest()] * 2 + [md5(b'a' * 1000).hexdigest(), md5(b'b' * 1000).hexdigest()]))
+
+    def test_cached_digests_are_not_computed_again(self):
+        with TempFolder() as source, TempFolder() as destination:
+            stat = os.stat(write_file(source, 'a.bin', b'abc'))
+            write_file(destination, 'a.bin', b'abc')
+            cache = {(stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns): 'cached'}
+            checksums = Checksums(source, lambda: LocalFileSystem(source), destination, lambda: LocalFileSystem(destination), cache)
+            self.assertEqual(checksums.compare('a.bin').result(), False)
+            self.assertEqual(len(checksums.cache), 2)
+
+    def test_compare_with_remote_digests(self):
+        with TempFolder() as source, TempFolder() as destination:
+            for i in range(20):
+                write_file(source, 'a%s.bin' % i, b'abc')
+                write_file(destination, 'a%s.bin' % i, b'abc' if i % 2 else b'def')
+            remote = {'host': 'localhost', 'path': destination}
+            checksums = Checksums(source, lambda: LocalFileSystem(source), remote, lambda: FakeRemoteFileSystem(destination), threads=4)
+            try:
+                comparisons = [checksums.compare('a%s.bin' % i) for i in range(20)]
+                self.assertEqual([comparison.result() for comparison in comparisons], [bool(i % 2) for i in range(20)])
+            finally:
+                checksums.close()
+            self.assertNotIn(threading.current_thread(), FakeRemoteFileSystem.threads)
+
+    def test_nothing_is_hashed_once_the_server_cannot(self):
+        with TempFolder() as source, TempFolder() as destination:
+            write_file(source, 'a.bin', b'abc')
+            write_file(destination, 'a.bin', b'abc')
+            remote = {'host': 'localhost', 'path': destination}
+            checksums = Checksums(source, lambda: LocalFileSystem(source), remote, lambda: FakeRemoteFileSystem(destination, can_hash=False))
+            try:
+                self.assertEqual(checksums.compare('a.bin').result(), None)
+                self.assertEqual(checksums.compare('missing.bin').result(), None)  # Not even looked for locally.
+            finally:
+                checksums.close()
+            self.assertEqual(len(checksums.cache), 1)
+
+if __name__ == '__main__':
+    main()
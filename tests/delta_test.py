@@ -0,0 +1,41 @@
+from unittest2 import TestCase, main
+from tests.test_utilities import TempFolder, write_file, read_file
+import os
+from sftpsync.filesystem import LocalFileSystem
+from sftpsync.delta import copy_delta, block_hashes, changed_ranges, BLOCK_SIZE
+
+
+class DeltaTest(TestCase):
+
+    def test_changed_ranges(self):
+        source      = b'a' * 16 + b'b' * 16 + b'c' * 16 + b'd' * 16
+        destination = b'a' * 16 + b'x' * 16 + b'y' * 16
+        self.assertEqual(changed_ranges(source, destination, 4 * BLOCK_SIZE - 10), [(BLOCK_SIZE, 3 * BLOCK_SIZE - 10)])
+        self.assertEqual(changed_ranges(source, source, 4 * BLOCK_SIZE), [])
+
+    def test_copy_delta_only_writes_changed_blocks(self):
+        with TempFolder() as source, TempFolder() as destination:
+            content = bytearray(os.urandom(10 * BLOCK_SIZE))
+            write_file(destination, 'a.bin', bytes(content))
+            content[3 * BLOCK_SIZE + 7] ^= 0xff
+            content += os.urandom(100)  # Appended data.
+            write_file(source, 'a.bin', bytes(content))
+            fs = LocalFileSystem(source)
+            written, hashes = copy_delta(fs, LocalFileSystem(destination), 'a.bin', fs.stat('a.bin'))
+            self.assertEqual(written, BLOCK_SIZE + 100)
+            self.assertEqual(read_file(destination, 'a.bin'), bytes(content))
+            with open(os.path.join(source, 'a.bin'), 'rb') as f:
+                self.assertEqual(hashes, block_hashes(f))
+
+    def test_copy_delta_truncates_shorter_source(self):
+        with TempFolder() as source, TempFolder() as destination:
+            content = os.urandom(3 * BLOCK_SIZE)
+            write_file(destination, 'a.bin', content)
+            write_file(source, 'a.bin', content[:BLOCK_SIZE + 5])
+            fs = LocalFileSystem(source)
+            written, _ = copy_delta(fs, LocalFileSystem(destination), 'a.bin', fs.stat('a.bin'))
+            self.assertEqual(written, 5)
+            self.assertEqual(read_file(destination, 'a.bin'), content[:BLOCK_SIZE + 5])
+
+if __name__ == '__main__':
+    main()
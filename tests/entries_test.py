@@ -0,0 +1,27 @@
+from unittest2 import TestCase, main
+from tests.planner_test import attributes, FOLDER
+from sftpsync.entries import Entry, entry
+from sftpsync.filesystem import is_dir, is_file
+
+
+class EntriesTest(TestCase):
+
+    def test_entry_from_attributes(self):
+        e = entry('a/b/c.txt', attributes(3, mtime=10.5))
+        self.assertEqual((e.path, e.filename), ('a/b/c.txt', 'c.txt'))
+        self.assertEqual((e.st_size, e.st_mtime, e.st_atime, e.hash), (3, 10, None, None))
+        self.assertTrue(is_file(e))
+        self.assertTrue(is_dir(entry('a', FOLDER)))
+
+    def test_entry_at_root(self):
+        self.assertEqual(entry('c.txt', attributes(3)).filename, 'c.txt')
+
+    def test_entry_shares_its_path_with_the_index(self):
+        path = '/'.join(['a', 'b.txt'])
+        self.assertIs(entry(path, attributes(1)).path, path)
+
+    def test_entry_has_no_dictionary(self):
+        self.assertFalse(hasattr(Entry('a', 1, 2, 3), '__dict__'))
+
+if __name__ == '__main__':
+    main()
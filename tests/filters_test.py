@@ -0,0 +1,70 @@
+from unittest2 import TestCase, main
+from sftpsync.filters import Filter
+
+
+class FiltersTest(TestCase):
+
+    def test_no_rules(self):
+        self.assertTrue(Filter([]).included('a/b.txt'))
+
+    def test_globs_match_names_at_any_depth(self):
+        path_filter = Filter([(False, '*.log'), (False, 'build')])
+        self.assertFalse(path_filter.included('a.log'))
+        self.assertFalse(path_filter.included('a/b/c.log'))
+        self.assertFalse(path_filter.included('a/build', folder=True))
+        self.assertFalse(path_filter.included('build'))
+        self.assertTrue(path_filter.included('a.log.txt'))
+        self.assertTrue(path_filter.included('a/builds', folder=True))
+
+    def test_globs_with_slashes_are_anchored(self):
+        path_filter = Filter([(False, '/build'), (False, 'docs/*.tmp'), (False, 'src/**/gen')])
+        self.assertFalse(path_filter.included('build', folder=True))
+        self.assertTrue(path_filter.included('a/build', folder=True))
+        self.assertFalse(path_filter.included('docs/a.tmp'))
+        self.assertTrue(path_filter.included('docs/a/b.tmp'))
+        self.assertTrue(path_filter.included('a/docs/a.tmp'))
+        self.assertFalse(path_filter.included('src/gen', folder=True))
+        self.assertFalse(path_filter.included('src/a/b/gen', folder=True))
+
+    def test_trailing_slash_only_matches_folders(self):
+        path_filter = Filter([(False, 'cache/')])
+        self.assertFalse(path_filter.included('a/cache', folder=True))
+        self.assertTrue(path_filter.included('a/cache'))
+
+    def test_wildcards_and_character_classes(self):
+        path_filter = Filter([(False, 'file?.[a-c]'), (False, '[!x]*.bak')])
+        self.assertFalse(path_filter.included('file1.b'))
+        self.assertTrue(path_filter.included('file12.b'))
+        self.assertTrue(path_filter.included('file1.d'))
+        self.assertFalse(path_filter.included('a.bak'))
+        self.assertTrue(path_filter.included('x.bak'))
+
+    def test_regular_expressions(self):
+        path_filter = Filter([(False, r're:(^|/)\.cache$'), (False, r're:\d{4}-(\d{2})')])
+        self.assertFalse(path_filter.included('.cache', folder=True))
+        self.assertFalse(path_filter.included('a/.cache', folder=True))
+        self.assertTrue(path_filter.included('a/.cache/b'))
+        self.assertFalse(path_filter.included('logs/2020-01.txt'))
+
+    def test_first_matching_rule_wins(self):
+        path_filter = Filter([(True, '*.c'), (True, '*/'), (False, '*')])
+        self.assertTrue(path_filter.included('a/b.c'))
+        self.assertTrue(path_filter.included('a', folder=True))
+        self.assertFalse(path_filter.included('a/b.h'))
+        path_filter = Filter([(False, '(a)'), (True, 're:(x)(y)'), (False, 're:x')])
+        self.assertTrue(path_filter.included('xy'))
+        self.assertFalse(path_filter.included('x'))
+        self.assertFalse(path_filter.included('(a)'))
+
+    def test_pruned(self):
+        path_filter = Filter([(False, 'node_modules/')])
+        self.assertTrue(path_filter.pruned('node_modules'))
+        self.assertTrue(path_filter.pruned('a/node_modules/b'))
+        self.assertFalse(path_filter.pruned('a/b'))
+        self.assertFalse(path_filter.pruned(''))
+
+    def test_invalid_regular_expression(self):
+        self.assertRaises(ValueError, Filter, [(False, 're:(')])
+
+if __name__ == '__main__':
+    main()
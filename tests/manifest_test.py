@@ -0,0 +1,49 @@
+from unittest2 import TestCase, main
+from tests.test_utilities import TempFolder
+from tests.planner_test import attributes
+import os
+from sftpsync.manifest import Manifest, SOURCE, DESTINATION, key
+
+REMOTE = {'user': 'yoda', 'pass': 'p4$$w0rd', 'host': 'sftp-server.example.com', 'path': '/data'}
+
+class ManifestTest(TestCase):
+
+    def test_save_and_load(self):
+        with TempFolder() as folder:
+            path = os.path.join(folder, 'manifest.sqlite')
+            manifest = Manifest(path, REMOTE, folder)
+            manifest.save(SOURCE, {'a.txt': attributes(1, mtime=10), 'sub/b.txt': attributes(2, mtime=20)})
+            manifest.close()
+
+            manifest = Manifest(path, REMOTE, folder)
+            entries = manifest.load(SOURCE)
+            self.assertEqual(sorted(entries), ['a.txt', 'sub/b.txt'])
+            self.assertEqual(entries['sub/b.txt'].filename, 'b.txt')
+            self.assertEqual(entries['sub/b.txt'].st_size,  2)
+            self.assertEqual(entries['sub/b.txt'].st_mtime, 20)
+            self.assertEqual(manifest.load(DESTINATION), {})
+            self.assertEqual(Manifest(path, folder, REMOTE).load(SOURCE), {})
+            manifest.close()
+
+    def test_save_replaces_previous_entries(self):
+        with TempFolder() as folder:
+            manifest = Manifest(os.path.join(folder, 'manifest.sqlite'), REMOTE, folder)
+            manifest.save(SOURCE, {'a.txt': attributes(1)})
+            manifest.save(SOURCE, {'b.txt': attributes(1)})
+            self.assertEqual(list(manifest.load(SOURCE)), ['b.txt'])
+            manifest.close()
+
+    def test_save_and_load_hashes(self):
+        with TempFolder() as folder:
+            manifest = Manifest(os.path.join(folder, 'manifest.sqlite'), REMOTE, folder)
+            manifest.save_hashes({(1, 2, 3, 4000000000): 'abc'})
+            manifest.save_hashes({(1, 2, 3, 5000000000): 'def', (1, 6, 7, 8): 'ghi'})
+            self.assertEqual(manifest.load_hashes(), {(1, 2, 3, 5000000000): 'def', (1, 6, 7, 8): 'ghi'})
+            manifest.close()
+
+    def test_key_ignores_passwords(self):
+        self.assertEqual(key(REMOTE, '.'), key(dict(REMOTE, **{'pass': 'changed'}), '.'))
+        self.assertNotEqual(key(REMOTE, '.'), key(dict(REMOTE, path='/other'), '.'))
+
+if __name__ == '__main__':
+    main()
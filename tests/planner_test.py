@@ -0,0 +1,57 @@
+from unittest2 import TestCase, main
+from tests.test_utilities import TempFolder, write_file
+from stat import S_IFDIR, S_IFREG
+from paramiko import SFTPAttributes
+from sftpsync.filesystem import LocalFileSystem
+from sftpsync.planner import index, plan
+
+
+def attributes(size=0, mtime=1000000000, mode=S_IFREG | 0o644):
+    attr = SFTPAttributes()
+    attr.st_size, attr.st_mtime, attr.st_mode = size, mtime, mode
+    return attr
+
+FOLDER = attributes(mode=S_IFDIR | 0o755)
+
+class PlannerTest(TestCase):
+
+    def test_index(self):
+        with TempFolder() as folder:
+            write_file(folder, 'a.txt', b'a')
+            write_file(folder, 'sub/b.txt', b'bb')
+            entries = index(lambda: LocalFileSystem(folder))
+            self.assertEqual(sorted(entries), ['a.txt', 'sub', 'sub/b.txt'])
+            self.assertEqual(entries['sub/b.txt'].st_size, 2)
+
+    def test_index_non_recursive(self):
+        with TempFolder() as folder:
+            write_file(folder, 'a.txt', b'a')
+            write_file(folder, 'sub/b.txt', b'bb')
+            self.assertEqual(sorted(index(lambda: LocalFileSystem(folder), recursive=False)), ['a.txt'])
+
+    def test_index_non_existing_root(self):
+        self.assertRaises(IOError, index, lambda: LocalFileSystem('/non/existing/folder'))
+
+    def test_plan(self):
+        source      = {'new.txt': attributes(1), 'same.txt': attributes(2), 'changed.txt': attributes(3), 'sub': FOLDER, 'sub/c.txt': attributes(4)}
+        destination = {'same.txt': attributes(2), 'changed.txt': attributes(5), 'old': FOLDER, 'old/d.txt': attributes(6)}
+        result = plan(source, destination)
+        self.assertEqual(result.folders, ['sub'])
+        self.assertEqual([path for path, _ in result.copy], ['changed.txt', 'new.txt', 'sub/c.txt'])
+        self.assertEqual([path for path, _ in result.skip], ['same.txt'])
+        self.assertEqual(result.delete, ['old/d.txt', 'old'])
+
+    def test_plan_force(self):
+        result = plan({'same.txt': attributes(2)}, {'same.txt': attributes(2)}, force=True)
+        self.assertEqual([path for path, _ in result.copy], ['same.txt'])
+
+    def test_plan_older_destination(self):
+        result = plan({'a.txt': attributes(2, mtime=20)}, {'a.txt': attributes(2, mtime=10)})
+        self.assertEqual([path for path, _ in result.copy], ['a.txt'])
+
+    def test_plan_preserve_requires_identical_modification_times(self):
+        self.assertEqual(len(plan({'a.txt': attributes(2, mtime=10)}, {'a.txt': attributes(2, mtime=20)}).skip), 1)
+        self.assertEqual(len(plan({'a.txt': attributes(2, mtime=10)}, {'a.txt': attributes(2, mtime=20)}, preserve=True).copy), 1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+from unittest2 import TestCase, main
+from tests.test_utilities import TempFolder, write_file
+from six import StringIO
+from threading import Thread
+from sftpsync.command_line import configure
+from sftpsync.sftpsync import sync
+from sftpsync.progress import Progress
+
+
+class ProgressTest(TestCase):
+
+    def test_progress_aggregates_transfers(self):
+        stream = StringIO()
+        with Progress(stream, interval=60) as progress:
+            progress.queued(3072)
+            progress.queued(1024)
+            with progress.transfer(3072) as callback:
+                self.assertEqual(progress.active, 1)
+                callback(1024)
+                callback(1024)
+            self.assertEqual((progress.files, progress.bytes, progress.active), (1, 3072, 0))
+            self.assertIn('3.0 KiB/4.0 KiB+ 1/2+ files', progress.line())
+            progress.done_walking()
+            self.assertIn('3.0 KiB/4.0 KiB 1/2 files', progress.line())
+            self.assertNotIn('--:--:--', progress.line())
+        self.assertTrue(stream.getvalue().startswith('\r'))
+        self.assertTrue(stream.getvalue().endswith('\n'))
+
+    def test_progress_redraws_at_a_low_rate(self):
+        stream = StringIO()
+        with Progress(stream, interval=60) as progress:
+            progress.queued(1024 * 1024)
+            with progress.transfer(1024 * 1024) as callback:
+                for _ in range(1024):
+                    callback(1024)
+        self.assertEqual(stream.getvalue().count('\r'), 1)
+
+    def test_transfer_shared_by_several_threads(self):
+        with Progress(StringIO(), interval=60) as progress:
+            progress.queued(8 * 10000)
+            with progress.transfer(8 * 10000) as callback:
+                threads = [Thread(target=lambda: [callback(1) for _ in range(10000)]) for _ in range(8)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                self.assertEqual((callback._sent, progress.bytes), (8 * 10000, 8 * 10000))
+            self.assertEqual(progress.bytes, 8 * 10000)
+
+    def test_sync_reports_progress(self):
+        with TempFolder() as source, TempFolder() as destination:
+            write_file(source, 'a.txt', b'a' * 100)
+            write_file(source, 'sub/b.txt', b'b' * 50)
+            with Progress(StringIO(), interval=60) as progress:
+                sync(configure(['-r', source, destination]), progress=progress)
+            self.assertEqual((progress.files, progress.total_files, progress.bytes, progress.total_bytes), (2, 2, 150, 150))
+            self.assertTrue(progress.walked)
+
+if __name__ == '__main__':
+    main()
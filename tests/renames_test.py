@@ -0,0 +1,46 @@
+from unittest2 import TestCase, main
+from tests.test_utilities import TempFolder, write_file
+import os
+from sftpsync.filesystem import LocalFileSystem
+from sftpsync.renames import Renames
+
+
+class RenamesTest(TestCase):
+
+    def test_added_then_orphaned(self):
+        with TempFolder() as source, TempFolder() as destination:
+            content = os.urandom(1000)
+            write_file(source, 'new/a.bin', content, mtime=1000000000)
+            write_file(destination, 'old/a.bin', content, mtime=2000000000)
+            source_fs, destination_fs = LocalFileSystem(source), LocalFileSystem(destination)
+            renames = Renames(source_fs, destination_fs)
+            self.assertIsNone(renames.added('new/a.bin', source_fs.stat('new/a.bin')))
+            self.assertEqual(renames.orphaned('old/a.bin', destination_fs.stat('old/a.bin'))[0], 'new/a.bin')
+            self.assertEqual(renames.unmatched(), ([], []))
+
+    def test_orphaned_then_added(self):
+        with TempFolder() as source, TempFolder() as destination:
+            content = os.urandom(1000)
+            write_file(source, 'a.bin', content)
+            write_file(destination, 'b.bin', content)
+            source_fs, destination_fs = LocalFileSystem(source), LocalFileSystem(destination)
+            renames = Renames(source_fs, destination_fs)
+            self.assertIsNone(renames.orphaned('b.bin', destination_fs.stat('b.bin')))
+            self.assertEqual(renames.added('a.bin', source_fs.stat('a.bin')), 'b.bin')
+
+    def test_different_content_does_not_match(self):
+        with TempFolder() as source, TempFolder() as destination:
+            write_file(source, 'a.bin', b'a' * 1000, mtime=1000000000)
+            write_file(destination, 'b.bin', b'b' * 1000, mtime=1000000000)
+            write_file(destination, 'c.bin', b'c' * 999, mtime=1000000000)
+            source_fs, destination_fs = LocalFileSystem(source), LocalFileSystem(destination)
+            renames = Renames(source_fs, destination_fs)
+            self.assertIsNone(renames.orphaned('b.bin', destination_fs.stat('b.bin')))
+            self.assertIsNone(renames.orphaned('c.bin', destination_fs.stat('c.bin')))
+            self.assertIsNone(renames.added('a.bin', source_fs.stat('a.bin')))
+            added, orphans = renames.unmatched()
+            self.assertEqual([path for path, _ in added], ['a.bin'])
+            self.assertEqual(sorted(path for path, _ in orphans), ['b.bin', 'c.bin'])
+
+if __name__ == '__main__':
+    main()
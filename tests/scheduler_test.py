@@ -0,0 +1,81 @@
+from unittest2 import TestCase, main
+from tests.test_utilities import TempFolder, write_file, read_file
+import time
+from threading import Thread
+from sftpsync.command_line import configure
+from sftpsync.sftpsync import sync
+from sftpsync.scheduler import Scheduler, TokenBucket
+
+
+class SchedulerTest(TestCase):
+
+    def test_fixed_scheduler(self):
+        scheduler = Scheduler(4, 64)
+        self.assertEqual((scheduler.limit, scheduler.window), (4, 64))
+        scheduler.failed()
+        scheduler.transferred(1024)
+        self.assertEqual((scheduler.limit, scheduler.window), (4, 64))
+
+    def test_adaptive_scheduler_slow_starts(self):
+        scheduler = Scheduler(16, 64, adaptive=True)
+        self.assertEqual(scheduler.limit, 1)
+        rate = 1000
+        with scheduler._condition:
+            for limit in (2, 4, 8, 16, 16):
+                scheduler._active = scheduler.limit
+                scheduler._adapt(rate)
+                self.assertEqual(scheduler.limit, limit)
+                rate *= 2
+
+    def test_adaptive_scheduler_only_grows_when_saturated(self):
+        scheduler = Scheduler(16, 64, adaptive=True)
+        with scheduler._condition:
+            scheduler._adapt(1000)
+        self.assertEqual(scheduler.limit, 1)
+
+    def test_adaptive_scheduler_backs_off(self):
+        scheduler = Scheduler(16, 64, adaptive=True)
+        scheduler.limit = 8
+        scheduler.failed()
+        self.assertEqual((scheduler.limit, scheduler.window), (4, 32))
+        scheduler._rate, scheduler._increased = 1000, True
+        scheduler._adapt(500)
+        self.assertEqual(scheduler.limit, 3)
+        self.assertEqual(scheduler.window, 40)
+
+    def test_scheduler_limits_concurrency(self):
+        scheduler = Scheduler(2, 64)
+        active, peak = [0], [0]
+
+        def transfer():
+            with scheduler:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+                time.sleep(0.01)
+                active[0] -= 1
+
+        threads = [Thread(target=transfer) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(peak[0], 2)
+
+    def test_token_bucket(self):
+        bucket = TokenBucket(100 * 1024)
+        start = time.time()
+        for _ in range(30):
+            bucket.take(10 * 1024)  # 300 KiB at 100 KiB/s, after a burst of 100 KiB.
+        self.assertGreater(time.time() - start, 1.8)
+
+    def test_sync_with_bwlimit(self):
+        with TempFolder() as source, TempFolder() as destination:
+            write_file(source, 'a.bin', b'a' * 200 * 1024)
+            start = time.time()
+            stats = sync(configure(['--adaptive', '--bwlimit', '100', source, destination]))
+            self.assertGreater(time.time() - start, 0.9)
+            self.assertEqual(stats['bytes'], 200 * 1024)
+            self.assertEqual(read_file(destination, 'a.bin'), b'a' * 200 * 1024)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+from unittest2 import TestCase, main
+from tests.test_utilities import TempFolder, write_file
+import json
+from sftpsync.command_line import configure
+from sftpsync.sftpsync import sync
+from sftpsync.stats import Stats
+
+
+class StatsTest(TestCase):
+
+    def test_count(self):
+        stats = Stats()
+        stats.count('copied')
+        stats.count('bytes', 10)
+        stats.count('errors')
+        self.assertEqual(stats.counters, {'copied': 1, 'skipped': 0, 'deleted': 0, 'bytes': 10, 'errors': 1})
+
+    def test_record(self):
+        stats = Stats()
+        stats.record('listing', 0.0005)
+        stats.record('listing', 0.003)
+        stats.record('listing', 0.003)
+        phase = stats.to_dict()['phases']['listing']
+        self.assertEqual(phase['count'], 3)
+        self.assertAlmostEqual(phase['seconds'], 0.0065)
+        self.assertAlmostEqual(phase['max'], 0.003)
+        self.assertEqual(phase['histogram'], {'1': 1, '4': 2})
+
+    def test_timer(self):
+        stats = Stats()
+        with stats.timer('diff'):
+            pass
+        self.assertEqual(stats.to_dict()['phases']['diff']['count'], 1)
+        self.assertEqual(len(stats.summary()), 1)
+
+    def test_to_json(self):
+        stats = Stats()
+        stats.record('transfer', 0.1)
+        self.assertEqual(sorted(json.loads(stats.to_json())), ['counters', 'elapsed', 'phases'])
+
+    def test_sync_records_phases(self):
+        with TempFolder() as source, TempFolder() as destination:
+            write_file(source, 'sub/a.txt', b'a')
+            write_file(destination, 'b.txt', b'b')
+            stats = Stats()
+            result = sync(configure(['-r', '--delete', source, destination]), stats=stats)
+            self.assertEqual(result['copied'], 1)
+            self.assertEqual(stats.counters['listed'], 3)
+            self.assertEqual(sorted(stats.phases), ['delete', 'diff', 'listing', 'metadata', 'transfer'])
+
+if __name__ == '__main__':
+    main()
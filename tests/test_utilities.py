@@ -43,6 +43,10 @@ class TempFile(object):
 class TempFolder(object):
     def __init__(self):
         self._folder = mkdtemp()
+    def __enter__(self):
+        return self._folder
+    def __exit__(self, type, value, traceback):
+        self._delete_folder()
     def _delete_folder(self):
         try:
             rmtree(self._folder)
@@ -67,3 +71,20 @@ class NonWritableFolder(TempFolder):
     def __exit__(self, type, value, traceback):
         os.chmod(self._folder, self._chmod)
         self._delete_folder()
+
+def write_file(folder, path, content=b'', mtime=None):
+    '''
+    Writes the provided content to folder/path, creating parent folders if needed, and returns the file's full path.
+    '''
+    full_path = os.path.join(folder, *path.split('/'))
+    if not os.path.isdir(os.path.dirname(full_path)):
+        os.makedirs(os.path.dirname(full_path))
+    with open(full_path, 'wb') as f:
+        f.write(content)
+    if mtime is not None:
+        os.utime(full_path, (mtime, mtime))
+    return full_path
+
+def read_file(folder, path):
+    with open(os.path.join(folder, *path.split('/')), 'rb') as f:
+        return f.read()
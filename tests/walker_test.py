@@ -0,0 +1,119 @@
+from unittest2 import TestCase, main
+from tests.test_utilities import TempFolder, write_file
+from threading import Lock
+from sftpsync.filesystem import LocalFileSystem
+from sftpsync.walker import walk, walk_folders
+from sftpsync.filters import Filter
+
+
+class ListingCounter(object):
+    '''
+    Local file system recording the folders listed through it, across all instances.
+    '''
+    listed = []
+    lock   = Lock()
+    def __init__(self, folder):
+        self._fs = LocalFileSystem(folder)
+    def listdir_attr(self, path=''):
+        with self.lock:
+            self.listed.append(path)
+        return self._fs.listdir_attr(path)
+    def stat(self, path=''):
+        return self._fs.stat(path)
+    def close(self):
+        pass
+
+class WalkerTest(TestCase):
+
+    def setUp(self):
+        ListingCounter.listed = []
+
+    def test_walk_wide_tree_in_parallel(self):
+        with TempFolder() as folder:
+            for i in range(50):
+                write_file(folder, 'folder%s/sub%s/file.txt' % (i, i % 5), b'x')
+            entries = list(walk(lambda: LocalFileSystem(folder), jobs=8))
+            paths = [path for path, _ in entries]
+            self.assertEqual(len(paths), 150)
+            self.assertEqual(len(set(paths)), 150)
+            for path in paths:  # Parents come before their children.
+                if '/' in path:
+                    self.assertLess(paths.index(path.rsplit('/', 1)[0]), paths.index(path))
+
+    def test_walk_non_recursive(self):
+        with TempFolder() as folder:
+            write_file(folder, 'a.txt')
+            write_file(folder, 'sub/b.txt')
+            self.assertEqual([path for path, _ in walk(lambda: LocalFileSystem(folder), recursive=False)], ['a.txt'])
+
+    def test_walk_non_existing_root(self):
+        self.assertRaises(IOError, list, walk(lambda: LocalFileSystem('/non/existing/folder')))
+
+    def test_walk_raises_errors_creating_file_systems(self):
+        def unreachable():
+            raise RuntimeError('Connection refused.')
+        with TempFolder() as folder:
+            self.assertRaises(RuntimeError, list, walk(unreachable))
+            self.assertRaises(RuntimeError, list, walk_folders([lambda: LocalFileSystem(folder), unreachable]))
+
+    def test_walk_stops_workers_when_closed_early(self):
+        with TempFolder() as folder:
+            for i in range(20):
+                write_file(folder, 'folder%s/file.txt' % i)
+            entries = walk(lambda: LocalFileSystem(folder), jobs=4)
+            next(entries)
+            entries.close()
+
+    def test_walk_reuses_cached_listings_of_unchanged_folders(self):
+        with TempFolder() as folder:
+            write_file(folder, 'unchanged/a.txt', b'a')
+            write_file(folder, 'unchanged/deep/b.txt', b'b')
+            write_file(folder, 'changed/c.txt', b'c')
+            cache = dict(walk(lambda: ListingCounter(folder)))
+            self.assertEqual(sorted(ListingCounter.listed), ['', 'changed', 'unchanged', 'unchanged/deep'])
+
+            cache['changed'].st_mtime -= 1
+            ListingCounter.listed = []
+            self.assertEqual(sorted(path for path, _ in walk(lambda: ListingCounter(folder), cache=cache)), sorted(cache))
+            self.assertEqual(sorted(ListingCounter.listed), ['', 'changed'])
+
+    def test_walk_lists_changed_folders_under_unchanged_ones(self):
+        with TempFolder() as folder:
+            write_file(folder, 'unchanged/a.txt', b'a')
+            write_file(folder, 'unchanged/deep/b.txt', b'b')
+            cache = dict(walk(lambda: ListingCounter(folder)))
+
+            write_file(folder, 'unchanged/deep/new.txt', b'new')
+            cache['unchanged/deep'].st_mtime -= 1
+            ListingCounter.listed = []
+            self.assertIn('unchanged/deep/new.txt', [path for path, _ in walk(lambda: ListingCounter(folder), cache=cache)])
+            self.assertEqual(sorted(ListingCounter.listed), ['', 'unchanged/deep'])
+
+    def test_walk_prunes_excluded_folders(self):
+        with TempFolder() as folder:
+            write_file(folder, 'a.txt')
+            write_file(folder, 'a.log')
+            write_file(folder, 'src/b.txt')
+            write_file(folder, 'src/node_modules/c/d.txt')
+            write_file(folder, 'src/node_modules.txt')
+            write_file(folder, '.cache/e.txt')
+            path_filter = Filter([(False, 'node_modules/'), (False, '.cache/'), (False, '*.log')])
+            self.assertEqual(sorted(path for path, _ in walk(lambda: ListingCounter(folder), path_filter=path_filter)), ['a.txt', 'src', 'src/b.txt', 'src/node_modules.txt'])
+            self.assertEqual(sorted(ListingCounter.listed), ['', 'src'])
+
+    def test_walk_folders_lists_folders_on_all_file_systems(self):
+        with TempFolder() as source, TempFolder() as destination:
+            write_file(source, 'a.txt')
+            write_file(source, 'both/b.txt')
+            write_file(source, 'source_only/c.txt')
+            write_file(destination, 'both/d.txt')
+            write_file(destination, 'destination_only/e.txt')
+            folders = dict(walk_folders([lambda: LocalFileSystem(source), lambda: LocalFileSystem(destination)], jobs=4))
+            names = lambda listing: sorted(a.filename for a in listing) if listing is not None else None
+            self.assertEqual(sorted(folders), ['', 'both', 'source_only'])
+            self.assertEqual([names(listing) for listing in folders['']], [['a.txt', 'both', 'source_only'], ['both', 'destination_only']])
+            self.assertEqual([names(listing) for listing in folders['both']], [['b.txt'], ['d.txt']])
+            self.assertEqual([names(listing) for listing in folders['source_only']], [['c.txt'], None])
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+from unittest2 import TestCase, main
+from tests.test_utilities import TempFolder, write_file
+import os
+import shutil
+from sftpsync.watch import Watcher
+
+
+class WatcherTest(TestCase):
+
+    def test_changes_in_files(self):
+        with TempFolder() as folder:
+            write_file(folder, 'a/b.txt', b'abc')
+            watcher = Watcher(folder)
+            try:
+                self.assertEqual(watcher.changes(0.05, timeout=0.05), set())
+                write_file(folder, 'a/b.txt', b'def')
+                write_file(folder, 'c.txt', b'ghi')
+                self.assertEqual(watcher.changes(0.05), set(['', 'a']))
+                os.remove(os.path.join(folder, 'a', 'b.txt'))
+                self.assertEqual(watcher.changes(0.05), set(['a']))
+            finally:
+                watcher.close()
+
+    def test_new_folders_are_watched(self):
+        with TempFolder() as folder:
+            watcher = Watcher(folder)
+            try:
+                write_file(folder, 'a/b/c.txt', b'abc')
+                self.assertEqual(watcher.changes(0.05), set(['', 'a', 'a/b']))
+                write_file(folder, 'a/b/d.txt', b'def')
+                self.assertEqual(watcher.changes(0.05), set(['a/b']))
+                os.rename(os.path.join(folder, 'a'), os.path.join(folder, 'e'))
+                self.assertEqual(watcher.changes(0.05), set(['', 'e', 'e/b']))
+                shutil.rmtree(os.path.join(folder, 'e'))
+                self.assertIn('', watcher.changes(0.05))
+                write_file(folder, 'f.txt', b'ghi')
+                self.assertEqual(watcher.changes(0.05), set(['']))
+            finally:
+                watcher.close()
+
+    def test_not_recursive(self):
+        with TempFolder() as folder:
+            write_file(folder, 'a/b.txt', b'abc')
+            watcher = Watcher(folder, recursive=False)
+            try:
+                write_file(folder, 'a/b.txt', b'def')
+                self.assertEqual(watcher.changes(0.05, timeout=0.1), set())
+            finally:
+                watcher.close()
+
+if __name__ == '__main__':
+    main()